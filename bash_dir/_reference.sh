@@ -1,5 +1,7 @@
+# The daemon watches reference_* folders with inotify and processes the files in one python process.
+# _all_references.sh is left for a manual one-time run of all handlers.
 while true;
 do
-	${XL_IDP_PATH_REFERENCE_SCRIPTS}/bash_dir/_all_references.sh;
+	python3 ${XL_IDP_PATH_REFERENCE_SCRIPTS}/scripts_for_bash_with_inheritance/reference_daemon.py;
 	sleep 1;
 done
\ No newline at end of file
@@ -2,12 +2,6 @@
 
 xls_path="${XL_IDP_PATH_REFERENCE}/reference_import_tracking/"
 
-
-csv_path="${xls_path}"/csv
-if [ ! -d "$csv_path" ]; then
-  mkdir "${csv_path}"
-fi
-
 done_path="${xls_path}"/done
 if [ ! -d "$done_path" ]; then
   mkdir "${done_path}"
@@ -28,45 +22,20 @@ do
 	mime_type=$(file -b --mime-type "$file")
   echo "'${file} - ${mime_type}'"
 
-  csv_name="${csv_path}/$(basename "${file}").csv"
-
-  if [[ ${mime_type} = "application/vnd.ms-excel" ]]
-  then
-    echo "Will convert XLS '${file}' to CSV '${csv_name}'"
-    in2csv -f xls "${file}" > "${csv_name}"
-  elif [[ ${mime_type} = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet" ]]
-  then
-    echo "Will convert XLSX or XLSM '${file}' to CSV '${csv_name}'"
-    in2csv -f xlsx "${file}" > "${csv_name}"
-  else
-    echo "ERROR: unsupported format ${mime_type}"
-    mv "${file}" "${xls_path}/error_$(basename "${file}")"
-    continue
-  fi
-
-  if [ $? -eq 0 ]
-	then
-	  mv "${file}" "${done_path}"
-	else
-	  mv "${file}" "${xls_path}/error_$(basename "${file}")"
-	  echo "ERROR during convertion ${file} to csv!"
-	  continue
-	fi
-
-	# Will convert csv to json
-	exit_message=$(python3 ${XL_IDP_PATH_REFERENCE_SCRIPTS}/scripts_for_bash_with_inheritance/reference_import_tracking.py "${csv_name}" "${json_path}" 2>&1 > /dev/null)
+	# Will convert xls/xlsx to json (REFERENCE_CSV_DEBUG=1 keeps a csv copy in csv/)
+	exit_message=$(python3 ${XL_IDP_PATH_REFERENCE_SCRIPTS}/scripts_for_bash_with_inheritance/reference_import_tracking.py "${file}" "${json_path}" 2>&1 > /dev/null)
 
   exit_code=$?
   echo "Exit code ${exit_code}"
   if [[ ${exit_code} == 0 ]]
 	then
-	  mv "${csv_name}" "${done_path}"
+	  mv "${file}" "${done_path}"
 	else
     for error_code in {1..9}
     do
       if [[ ${exit_code} == "${error_code}" ]]
       then
-        mv "${csv_name}" "${xls_path}/error_code_${exit_message}_$(basename "${csv_name}")"
+        mv "${file}" "${xls_path}/error_code_${exit_message}_$(basename "${file}")"
       fi
     done
 	fi
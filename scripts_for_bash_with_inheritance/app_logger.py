@@ -1,23 +1,217 @@
 import os
+import re
+import copy
+import queue
+import atexit
 import logging
+import threading
+from datetime import date
+from typing import Dict, Optional
+from logging.handlers import QueueHandler, QueueListener
 
 _log_format: str = "[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s"
 _dateftm: str = "%d/%B/%Y %H:%M:%S"
 
+# queue - the records are formatted and written to the files by a background thread, file - in the calling thread.
+LOG_BACKEND: str = os.environ.get("REFERENCE_LOG_BACKEND", "queue")
+# Info messages with extra=SAMPLE_ROWS: the first SAMPLE_FIRST messages of the logger are written,
+# then every SAMPLE_EVERY-th one (1 - all messages, 0 - none after the first ones).
+SAMPLE_FIRST: int = int(os.environ.get("REFERENCE_LOG_SAMPLE_FIRST", 20))
+SAMPLE_EVERY: int = int(os.environ.get("REFERENCE_LOG_SAMPLE_EVERY", 1000))
 
-def get_file_handler(name: str) -> logging.FileHandler:
+# logger.info("Row %s is %s", index, row, extra=app_logger.SAMPLE_ROWS) - per-row message, which is sampled.
+SAMPLE_ROWS: dict = {"sample": "rows"}
+
+# <script>_<date>: the date is fixed when the module is imported, so the file of the day is chosen for every record.
+DAILY_NAME_PATTERN: re.Pattern = re.compile(r"(?P<prefix>.+_)\d{4}-\d{2}-\d{2}")
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, first: int = SAMPLE_FIRST, every: int = SAMPLE_EVERY):
+        """
+        Pass the first messages of every category (extra={"sample": category}) and then every N-th one.
+        The messages without a category and warnings and errors always pass.
+        """
+        super().__init__()
+        self.first: int = first
+        self.every: int = every
+        self.counts: Dict[tuple, int] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category: Optional[str] = getattr(record, "sample", None)
+        if category is None or record.levelno >= logging.WARNING:
+            return True
+        with self.lock:
+            count: int = self.counts.get((record.name, category), 0) + 1
+            self.counts[record.name, category] = count
+        if count <= self.first:
+            return True
+        return self.every > 0 and (count - self.first) % self.every == 0
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counts.clear()
+
+
+class RecordQueueHandler(QueueHandler):
+    def __init__(self, name: str):
+        """
+        Put the records of the logger into the queue of the process. The file is written by the listener thread.
+        """
+        super().__init__(None)
+        self.log_name: str = name
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        get_queue().put_nowait(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Only the message is formatted here (the arguments may change after the call). The time, the exception
+        and the line of the file are formatted in the listener thread.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.log_name = self.log_name
+        return record
+
+
+class DailyFileHandler(logging.FileHandler):
+    def __init__(self, log_dir_name: str, prefix: str):
+        """
+        Write the records into <prefix><date>.log by the date of the record, so a long-running process
+        (reference_daemon) starts a new file every day, like the scripts started by cron.
+        """
+        self.log_dir_name: str = log_dir_name
+        self.prefix: str = prefix
+        self.day: str = str(date.today())
+        super().__init__(self.get_path(self.day), delay=True)
+
+    def get_path(self, day: str) -> str:
+        return os.path.abspath(f"{self.log_dir_name}/{self.prefix}{day}.log")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        day: str = str(date.fromtimestamp(record.created))
+        if day != self.day:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self.day = day
+            self.baseFilename = self.get_path(day)
+        super().emit(record)
+
+
+class FileRouter(logging.Handler):
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        Write the record into the file of its logger.
+        """
+        file_handler: Optional[logging.FileHandler] = file_handlers.get(record.log_name)
+        if file_handler is not None:
+            file_handler.handle(record)
+
+
+file_handlers: Dict[str, logging.FileHandler] = {}
+sampling_filter: SamplingFilter = SamplingFilter()
+lock: threading.Lock = threading.Lock()
+record_queue: Optional[queue.SimpleQueue] = None
+listener: Optional[QueueListener] = None
+listener_pid: Optional[int] = None
+
+
+def get_queue() -> queue.SimpleQueue:
+    """
+    Queue of the current process. The listener thread is started on the first message and again after fork,
+    because the child process gets the queue of the parent without its thread.
+    """
+    global record_queue, listener, listener_pid
+    if listener_pid != os.getpid():
+        with lock:
+            if listener_pid != os.getpid():
+                record_queue = queue.SimpleQueue()
+                listener = QueueListener(record_queue, FileRouter())
+                listener.start()
+                listener_pid = os.getpid()
+    return record_queue
+
+
+def flush() -> None:
+    """
+    Wait until the listener writes all records. A new listener is started on the next message.
+    """
+    global listener, listener_pid
+    with lock:
+        if listener is not None and listener_pid == os.getpid():
+            listener.stop()
+        listener = None
+        listener_pid = None
+
+
+def reset_sampling() -> None:
+    """
+    Start sampling from the beginning, e.g. for the next file in the same process.
+    """
+    sampling_filter.reset()
+
+
+def get_file_handler(name: str, daily_prefix: Optional[str] = None) -> logging.FileHandler:
     log_dir_name: str = f"{os.environ.get('XL_IDP_PATH_REFERENCE_SCRIPTS')}/logging"
     if not os.path.exists(log_dir_name):
-        os.mkdir(log_dir_name)
-    file_handler: logging.FileHandler = logging.FileHandler(f"{log_dir_name}/{name}.log")
+        os.makedirs(log_dir_name, exist_ok=True)
+    file_handler: logging.FileHandler
+    if daily_prefix is not None:
+        file_handler = DailyFileHandler(log_dir_name, daily_prefix)
+    else:
+        file_handler = logging.FileHandler(f"{log_dir_name}/{name}.log")
     file_handler.setFormatter(logging.Formatter(_log_format, datefmt=_dateftm))
     return file_handler
 
 
+def get_logger_name(name: str) -> str:
+    """
+    reference_lines_2024-01-31 -> reference_lines: the date is not a part of the logger, only of its file.
+    """
+    match: Optional[re.Match] = DAILY_NAME_PATTERN.fullmatch(name)
+    return match["prefix"][:-1] if match else name
+
+
 def get_logger(name: str) -> logging.getLogger:
+    """
+    Logger which writes into <name>.log. For the names <script>_<date> the file is <script>_<date of the record>.log.
+    """
+    match: Optional[re.Match] = DAILY_NAME_PATTERN.fullmatch(name)
+    daily_prefix: Optional[str] = match["prefix"] if match else None
+    name = get_logger_name(name)
     logger: logging.getLogger = logging.getLogger(name)
     if logger.hasHandlers():
         logger.handlers.clear()
-    logger.addHandler(get_file_handler(name))
+    if LOG_BACKEND == "queue":
+        previous_handler: Optional[logging.FileHandler] = file_handlers.get(name)
+        file_handlers[name] = get_file_handler(name, daily_prefix)
+        if previous_handler is not None:
+            previous_handler.close()
+        logger.addHandler(RecordQueueHandler(name))
+    else:
+        logger.addHandler(get_file_handler(name, daily_prefix))
+    logger.addFilter(sampling_filter)
     logger.setLevel(logging.INFO)
     return logger
+
+
+def release_logger(name: str) -> None:
+    """
+    Write the remaining records and close the file of the logger (for loggers created per input file).
+    """
+    flush()
+    name = get_logger_name(name)
+    logger: logging.getLogger = logging.getLogger(name)
+    for handler in logger.handlers:
+        handler.close()
+    logger.handlers.clear()
+    file_handler: Optional[logging.FileHandler] = file_handlers.pop(name, None)
+    if file_handler is not None:
+        file_handler.close()
+
+
+atexit.register(flush)
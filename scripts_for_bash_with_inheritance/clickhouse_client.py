@@ -0,0 +1,138 @@
+import time
+import atexit
+import app_logger
+from __init__ import *
+from datetime import datetime
+from typing import Dict, Optional
+from clickhouse_connect import get_client
+from clickhouse_connect.driver import Client
+from clickhouse_connect.driver.common import StreamContext
+from clickhouse_connect.driver.exceptions import OperationalError
+
+COMPRESS: bool = os.environ.get("REFERENCE_CLICKHOUSE_COMPRESS", "1").lower() in ("1", "true", "yes")
+CONNECT_TIMEOUT: int = int(os.environ.get("REFERENCE_CLICKHOUSE_CONNECT_TIMEOUT", 10))
+SEND_RECEIVE_TIMEOUT: int = int(os.environ.get("REFERENCE_CLICKHOUSE_SEND_RECEIVE_TIMEOUT", 300))
+RETRIES: int = int(os.environ.get("REFERENCE_CLICKHOUSE_RETRIES", 3))
+BACKOFF: float = float(os.environ.get("REFERENCE_CLICKHOUSE_BACKOFF", 1))
+# Queries which take longer are logged as warnings.
+SLOW_QUERY_SECONDS: float = float(os.environ.get("REFERENCE_CLICKHOUSE_SLOW_QUERY_SECONDS", 5))
+
+logger: app_logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.now().date()))
+
+
+def retry(action, description: str, retries: int = RETRIES, backoff: float = BACKOFF):
+    """
+    Run the action, retrying network errors with exponential backoff.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return action()
+        except OperationalError as ex:
+            if attempt == retries:
+                raise
+            logger.warning(f"{description} failed. Error is {ex}. Attempt {attempt + 1}")
+            time.sleep(backoff * 2 ** attempt)
+
+
+class TimedClient(object):
+    def __init__(self, client: Client, database: str):
+        """
+        Shared client of ClickHouse. The duration of queries is logged, read queries are retried on network errors.
+        close() does nothing: the connection stays in the pool until the end of the process.
+        """
+        self.client: Client = client
+        self.database: str = database
+
+    def __getattr__(self, name: str):
+        return getattr(self.client, name)
+
+    def log_duration(self, method: str, query: str, started: float) -> None:
+        duration: float = time.monotonic() - started
+        message: str = f"{method} in {self.database} took {duration:.3f} s: {str(query)[:200]}"
+        logger.warning(message) if duration > SLOW_QUERY_SECONDS else logger.info(message)
+
+    def timed(self, method: str, query: str, action):
+        started: float = time.monotonic()
+        try:
+            return action()
+        finally:
+            self.log_duration(method, query, started)
+
+    def query(self, query: str, *args, **kwargs):
+        return self.timed("query", query, lambda: retry(lambda: self.client.query(query, *args, **kwargs), "Query"))
+
+    def command(self, cmd: str, *args, **kwargs):
+        return self.timed("command", cmd, lambda: self.client.command(cmd, *args, **kwargs))
+
+    def insert(self, table: str, *args, **kwargs):
+        return self.timed("insert", f"INSERT INTO {table}", lambda: self.client.insert(table, *args, **kwargs))
+
+    def query_row_block_stream(self, query: str, *args, **kwargs) -> "TimedStream":
+        started: float = time.monotonic()
+        stream: StreamContext = self.client.query_row_block_stream(query, *args, **kwargs)
+        return TimedStream(stream, lambda: self.log_duration("stream", query, started))
+
+    def close(self) -> None:
+        pass
+
+
+class TimedStream(object):
+    def __init__(self, stream: StreamContext, on_close):
+        """
+        Stream of blocks which logs the duration of the query when the consumer leaves the context,
+        so the time of reading all blocks is included, not only the start of the query.
+        """
+        self.stream: StreamContext = stream
+        self.on_close = on_close
+
+    def __enter__(self) -> "TimedStream":
+        self.stream.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            self.stream.__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.on_close()
+
+    def __iter__(self) -> "TimedStream":
+        return self
+
+    def __next__(self):
+        return next(self.stream)
+
+
+clients: Dict[str, TimedClient] = {}
+
+
+def get_clickhouse_client(database: Optional[str] = None) -> TimedClient:
+    """
+    Get a client of ClickHouse for the database (DATABASE by default). The client is created once per process,
+    checked with ping before it is given out again and recreated if the connection is lost.
+    The connection is retried with backoff, the last error is raised, so every script keeps its own exit code.
+    """
+    database = database or get_my_env_var('DATABASE')
+    client: Optional[TimedClient] = clients.get(database)
+    if client is not None:
+        if client.client.ping():
+            return client
+        logger.warning(f"Connection to {database} is lost. Reconnecting")
+        client.client.close()
+
+    def connect() -> Client:
+        # get_client already queries the version of the server, so the connection is checked here.
+        return get_client(host=get_my_env_var('HOST'), database=database,
+                          username=get_my_env_var('USERNAME_DB'), password=get_my_env_var('PASSWORD'),
+                          compress=COMPRESS, connect_timeout=CONNECT_TIMEOUT, send_receive_timeout=SEND_RECEIVE_TIMEOUT)
+
+    started: float = time.monotonic()
+    clients[database] = TimedClient(retry(connect, f"Connection to {database}"), database)
+    logger.info(f"Connected to {database} in {time.monotonic() - started:.3f} s")
+    return clients[database]
+
+
+@atexit.register
+def close_all() -> None:
+    for client in clients.values():
+        client.client.close()
+    clients.clear()
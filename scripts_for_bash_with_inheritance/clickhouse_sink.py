@@ -0,0 +1,195 @@
+import re
+import sys
+import app_logger
+import contextlib
+from __init__ import *
+from datetime import datetime, date
+from clickhouse_client import get_clickhouse_client
+from clickhouse_connect.driver import Client
+from json_writer import JsonWriter, write_json
+from typing import Callable, Dict, Iterable, List, Optional
+
+# json - write json files for the loader (as before), clickhouse - insert into the reference tables, both - both.
+OUTPUT_MODES: tuple = ("json", "clickhouse", "both")
+OUTPUT_MODE: str = os.environ.get("REFERENCE_OUTPUT", "json")
+# Records in one insert. 0 - the whole file in one insert: a file which fails is not loaded partly,
+# but all its columns are kept in memory until the end.
+BATCH_SIZE: int = int(os.environ.get("REFERENCE_CLICKHOUSE_BATCH_SIZE", 10000))
+
+logger: app_logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.now().date()))
+
+
+class ClickHouseSinkError(Exception):
+    pass
+
+
+def to_date(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value[:10])
+
+
+def to_datetime(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(value)
+
+
+def to_int(value) -> int:
+    return int(float(value)) if isinstance(value, str) else int(value)
+
+
+def to_bool(value) -> bool:
+    return value.strip().upper() in ['ДА', 'ИСТИНА', 'TRUE', '1'] if isinstance(value, str) else bool(value)
+
+
+# Converters by the type of the column in ClickHouse (without Nullable and LowCardinality).
+TYPE_CONVERTERS: Dict[str, Callable] = {
+    "Date": to_date,
+    "Date32": to_date,
+    "DateTime": to_datetime,
+    "DateTime64": to_datetime,
+    "Int": to_int,
+    "UInt": to_int,
+    "Float": float,
+    "Bool": to_bool,
+    "String": str
+}
+
+
+def get_base_type(type_name: str) -> str:
+    """
+    Nullable(LowCardinality(DateTime64(3))) -> DateTime64, UInt32 -> UInt.
+    """
+    while True:
+        match = re.fullmatch(r"(?:Nullable|LowCardinality)\((.*)\)", type_name)
+        if not match:
+            break
+        type_name = match[1]
+    type_name = type_name.split("(", 1)[0]
+    return re.sub(r"\d+$", "", type_name) if type_name.startswith(("Int", "UInt", "Float")) else type_name
+
+
+class ClickHouseSink(object):
+    def __init__(self, table: str, batch_size: int = BATCH_SIZE, client: Optional[Client] = None):
+        """
+        Insert records into the ClickHouse table with batched columnar inserts.
+        The values are converted by the types of the columns of the table (DESCRIBE TABLE).
+        The batches which are inserted before an error stay in the table. With batch_size=0 the file is inserted
+        in one insert, so a file which fails can be loaded again without duplicates.
+        :param table: Table name.
+        :param batch_size: Number of records in one insert (0 - all records in one insert).
+        :param client: Client of ClickHouse. By default, a new client is created and closed at the end.
+        """
+        self.table: str = table
+        self.batch_size: int = batch_size
+        self.client: Optional[Client] = client
+        self.is_own_client: bool = client is None
+        self.table_columns: Dict[str, str] = {}
+        self.column_names: Optional[List[str]] = None
+        self.converters: List[Optional[Callable]] = []
+        self.nullable: List[bool] = []
+        self.columns: List[list] = []
+        self.count: int = 0
+        self.inserted: int = 0
+
+    def __enter__(self) -> "ClickHouseSink":
+        try:
+            if self.client is None:
+                self.client = get_clickhouse_client()
+            query: str = f"DESCRIBE TABLE {self.table}"
+            self.table_columns = {row[0]: row[1] for row in self.client.query(query).result_rows}
+        except Exception as ex_connect:
+            raise ClickHouseSinkError(f"Error connection to db {ex_connect}") from ex_connect
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            if exc_type is None:
+                self.flush()
+                logger.info(f"{self.count} records are inserted into {self.table}")
+        finally:
+            if self.is_own_client and self.client is not None:
+                self.client.close()
+
+    def set_columns(self, record: dict) -> None:
+        """
+        Take the columns of the first record which exist in the table.
+        """
+        self.column_names = [column for column in record if column in self.table_columns]
+        skipped: List[str] = [column for column in record if column not in self.table_columns]
+        if skipped:
+            logger.warning(f"Columns {skipped} are not in the table {self.table} and will not be inserted")
+        for column in self.column_names:
+            type_name: str = self.table_columns[column]
+            self.converters.append(TYPE_CONVERTERS.get(get_base_type(type_name)))
+            self.nullable.append("Nullable" in type_name)
+        self.columns = [[] for _ in self.column_names]
+
+    def convert(self, index: int, value):
+        if value is None or (value == "" and self.nullable[index]):
+            return None
+        converter: Optional[Callable] = self.converters[index]
+        try:
+            return converter(value) if converter else value
+        except (ValueError, TypeError) as ex_convert:
+            raise ClickHouseSinkError(
+                f"Value {value!r} of the column {self.column_names[index]} can't be converted. {ex_convert}"
+            ) from ex_convert
+
+    def write(self, record: dict) -> None:
+        """
+        Add the record into the batch and insert the batch when it is full.
+        """
+        if self.column_names is None:
+            self.set_columns(record)
+        for index, column in enumerate(self.column_names):
+            self.columns[index].append(self.convert(index, record.get(column)))
+        self.count += 1
+        if self.batch_size and len(self.columns[0]) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.columns or not self.columns[0]:
+            return
+        try:
+            self.client.insert(self.table, self.columns, column_names=self.column_names, column_oriented=True)
+        except Exception as ex_insert:
+            raise ClickHouseSinkError(
+                f"Failed to insert data into {self.table}. {ex_insert}. "
+                f"Records inserted before the error: {self.inserted}"
+            ) from ex_insert
+        self.inserted += len(self.columns[0])
+        self.columns = [[] for _ in self.column_names]
+
+
+def write_output(output_file_path: str, records: Iterable, table: str, default: Optional[Callable] = None) -> int:
+    """
+    Write records to json and/or insert them into the table depending on REFERENCE_OUTPUT.
+    :return: Number of records.
+    """
+    if OUTPUT_MODE == "json":
+        return write_json(output_file_path, records, default=default)
+    if OUTPUT_MODE not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode {OUTPUT_MODE}. Expected one of {OUTPUT_MODES}")
+    try:
+        with contextlib.ExitStack() as stack:
+            writer: Optional[JsonWriter] = None
+            if OUTPUT_MODE == "both":
+                writer = stack.enter_context(JsonWriter(output_file_path, default=default))
+            sink: ClickHouseSink = stack.enter_context(ClickHouseSink(table))
+            for record in records:
+                sink.write(record)
+                if writer:
+                    writer.write(record)
+            return sink.count
+    except ClickHouseSinkError as ex_insert:
+        logger.error(f"Failed to insert data into {table}. Error is {ex_insert}. Type error is {type(ex_insert)}")
+        print("error_insert_db", file=sys.stderr)
+        telegram(f'Не удалось загрузить данные в таблицу {table}. Файл {os.path.basename(output_file_path)}. '
+                 f'Ошибка {ex_insert}')
+        sys.exit(1)
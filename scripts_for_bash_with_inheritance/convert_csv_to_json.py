@@ -1,36 +1,29 @@
-import csv
-import json
 import os
 import sys
 import datetime
-import logging
+import app_logger
+from excel_reader import read_dicts
+from json_writer import write_json
 
-if not os.path.exists("logging"):
-    os.mkdir("logging")
+logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.datetime.now().date()))
 
-logging.basicConfig(filename="logging/{}.log".format(os.path.basename(__file__)), level=logging.DEBUG)
-log = logging.getLogger()
 
-file = os.path.abspath(sys.argv[1])
-json_file = sys.argv[2]
+def read_CSV(file):
+    logger.info(u'file is %s %s', os.path.basename(file), datetime.datetime.now())
+    for row in read_dicts(file):
+        logger.info(u'data is %s', row, extra=app_logger.SAMPLE_ROWS)
+        yield {key: value.strip() for key, value in row.items()}
 
 
-def read_CSV(file, json_file):
-    logging.info(u'file is {} {}'.format(os.path.basename(file), datetime.datetime.now()))
-    csv_rows = []
-    with open(file) as csvfile:
-        reader = csv.DictReader(csvfile)
-        field = reader.fieldnames
-        for row in reader:
-            csv_rows.extend([{field[i]: row[field[i]].strip() for i in range(len(field))}])
-            logging.info(u'data is {}'.format(row))
-        convert_write_json(csv_rows, json_file)
+def convert_write_json(data, json_file):
+    write_json(f"{json_file}.json", data)
 
 
-def convert_write_json(data, json_file):
-    with open(f"{json_file}.json", "w") as f:
-        f.write(json.dumps(data, ensure_ascii=False, sort_keys=False, indent=4, separators=(',', ': ')))  # for pretty
+def main(file, json_file):
+    convert_write_json(read_CSV(os.path.abspath(file)), json_file)
+
 
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
 
-read_CSV(file, json_file)
 
@@ -0,0 +1,90 @@
+import re
+import contextlib
+import pandas as pd
+from _strptime import TimeRE
+from datetime import datetime
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Number of distinct values which are parsed one by one to find the format of the column.
+SAMPLE_SIZE: int = 100
+
+time_re: TimeRE = TimeRE()
+# strptime accepts the seconds 60 and 61 in the regular expression and rejects them later, pandas accepts them.
+# Such values are parsed one by one.
+time_re["S"] = r"(?P<S>[0-5]\d|\d)"
+
+
+def parse_one(value: str, formats: Sequence[str]) -> Optional[datetime]:
+    """
+    The first format which fits, as `for fmt in formats: datetime.strptime(value, fmt)`.
+    """
+    for date_format in formats:
+        with contextlib.suppress(ValueError):
+            return datetime.strptime(value, date_format)
+    return None
+
+
+def infer_format(values: Sequence[str], formats: Sequence[str]) -> Optional[int]:
+    """
+    Index of the format which fits most of the values.
+    """
+    counts: Counter = Counter()
+    for value in values:
+        for index, date_format in enumerate(formats):
+            with contextlib.suppress(ValueError):
+                datetime.strptime(value, date_format)
+                counts[index] += 1
+                break
+    return counts.most_common(1)[0][0] if counts else None
+
+
+def matches_format(values: pd.Series, date_format: str) -> pd.Series:
+    """
+    Mask of the values which have the form of the format, with the same regular expression as in strptime.
+    """
+    return values.str.fullmatch(time_re.pattern(date_format), flags=re.IGNORECASE).fillna(False).astype(bool)
+
+
+def parse_with_format(values: List[str], formats: Sequence[str], index: int) -> Dict[str, datetime]:
+    """
+    Parse the values with formats[index] at once. The values which fit one of the previous formats
+    or are not parsed are not in the result: they are parsed one by one.
+    """
+    series: pd.Series = pd.Series(values, dtype=object)
+    dates: pd.Series = pd.to_datetime(series, format=formats[index], errors="coerce")
+    mask: pd.Series = dates.notna() & matches_format(series, formats[index])
+    for date_format in formats[:index]:
+        mask &= ~matches_format(series, date_format)
+    return {value: date.to_pydatetime() for value, date, is_parsed in zip(values, dates, mask) if is_parsed}
+
+
+def parse_dates(values: Sequence, formats: Sequence[str], convert: Callable[[datetime], str]) -> List[Optional[str]]:
+    """
+    Parse a column of dates. The result is the same as parsing every value with the first format which fits,
+    but every distinct string is parsed once, and most of them are parsed together with the format of the column.
+    :param values: Values of the column. Values which are not strings are not parsed.
+    :param formats: Formats for strptime in the order of priority.
+    :param convert: Conversion of the parsed date, e.g. to a string.
+    :return: Converted dates, None for the values which do not fit any format.
+    """
+    distinct_values: List[str] = list(dict.fromkeys(value for value in values if isinstance(value, str)))
+    parsed: Dict[str, datetime] = {}
+    index: Optional[int] = infer_format(distinct_values[:SAMPLE_SIZE], formats)
+    if index is not None:
+        parsed = parse_with_format(distinct_values, formats, index)
+    converted: Dict[str, Optional[str]] = {}
+    for value in distinct_values:
+        date: Optional[datetime] = parsed[value] if value in parsed else parse_one(value, formats)
+        converted[value] = convert(date) if date is not None else None
+    return [converted[value] if isinstance(value, str) else None for value in values]
+
+
+def to_dates(values: pd.Series) -> pd.Series:
+    """
+    pd.to_datetime(values).dt.date over the distinct values only. The format is guessed by pandas
+    from the first value, as before.
+    """
+    distinct_values: pd.Series = pd.Series(values.unique(), dtype=object)
+    dates: pd.Series = pd.to_datetime(distinct_values).dt.date
+    return values.map(dict(zip(distinct_values, dates)))
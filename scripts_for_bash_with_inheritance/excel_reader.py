@@ -0,0 +1,232 @@
+import os
+import csv
+import xlrd
+import string
+import zipfile
+import datetime
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from xml.etree.ElementTree import iterparse
+from openpyxl.utils.cell import range_boundaries
+from typing import Dict, Iterator, List, Optional, Tuple
+from openpyxl.packaging.relationship import get_dependents, get_rels_path
+
+XLS_SIGNATURE: bytes = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+XLSX_SIGNATURE: bytes = b"PK\x03\x04"
+SHEET_NAMESPACE: str = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIP_ID: str = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+# Set to 1 to keep a copy of the rows in <folder>/csv/<file>.csv, as in2csv used to do.
+CSV_DEBUG: bool = os.environ.get("REFERENCE_CSV_DEBUG", "0").lower() in ("1", "true", "yes")
+
+
+def get_file_format(file_path: str) -> str:
+    """
+    Get the format of the file by its signature, not by the extension.
+    """
+    with open(file_path, "rb") as f:
+        signature: bytes = f.read(8)
+    if signature == XLS_SIGNATURE:
+        return "xls"
+    if signature.startswith(XLSX_SIGNATURE) and zipfile.is_zipfile(file_path):
+        return "xlsx"
+    if file_path.lower().endswith(".csv"):
+        return "csv"
+    raise ValueError(f"Unsupported format of the file {file_path}")
+
+
+def format_cell(value) -> str:
+    """
+    Convert the value of a cell to a string in the same way as in2csv.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, datetime.datetime):
+        # in2csv writes the date only if there is no time.
+        return value.date().isoformat() if value.time() == datetime.time() else value.isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def letter_name(index: int) -> str:
+    """
+    Name of a column without header: a, b, ..., z, aa, bb, ...
+    """
+    letters: str = string.ascii_lowercase
+    return letters[index % len(letters)] * (index // len(letters) + 1)
+
+
+def get_header(row: List[str]) -> List[str]:
+    """
+    Fill empty column names and make the duplicates unique (name, name_2, name_3, ...).
+    """
+    header: List[str] = []
+    for index, column in enumerate(row):
+        column = column or letter_name(index)
+        unique_column: str = column
+        duplicates: int = 2
+        while unique_column in header:
+            unique_column = f"{column}_{duplicates}"
+            duplicates += 1
+        header.append(unique_column)
+    return header
+
+
+def iter_xls_rows(file_path: str) -> Iterator[list]:
+    """
+    Read the first sheet of an xls file.
+    """
+    book: xlrd.Book = xlrd.open_workbook(file_path, on_demand=True)
+    try:
+        sheet: xlrd.sheet.Sheet = book.sheet_by_index(0)
+        for index in range(sheet.nrows):
+            row: list = []
+            for cell in sheet.row(index):
+                if cell.ctype == xlrd.XL_CELL_DATE:
+                    row.append(xlrd.xldate.xldate_as_datetime(cell.value, book.datemode))
+                elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+                    row.append(bool(cell.value))
+                elif cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+                    row.append(None)
+                else:
+                    row.append(cell.value)
+            yield row
+    finally:
+        book.release_resources()
+
+
+def iter_xlsx_rows(file_path: str) -> Iterator[tuple]:
+    """
+    Read the first sheet of an xlsx file in the read-only (streaming) mode.
+    """
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb[wb.sheetnames[0]]
+        ws.reset_dimensions()
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def read_hyperlinks(archive: zipfile.ZipFile, sheet_path: str) -> Dict[int, Dict[int, Tuple[str, str]]]:
+    """
+    Read the hyperlinks of the sheet: number of the row from 1 -> index of the column from 0 -> (target, location).
+    The sheet xml is parsed as a stream, the rows are dropped right after they are read.
+    """
+    rels_path: str = get_rels_path(sheet_path)
+    targets: Dict[str, str] = {}
+    if rels_path in archive.namelist():
+        targets = {rel.Id: rel.Target for rel in get_dependents(archive, rels_path).Relationship}
+    hyperlinks: Dict[int, Dict[int, Tuple[str, str]]] = {}
+    with archive.open(sheet_path) as source:
+        for _, element in iterparse(source):
+            if element.tag == f"{SHEET_NAMESPACE}hyperlink":
+                min_col, min_row, max_col, max_row = range_boundaries(element.get("ref"))
+                link: Tuple[str, str] = targets.get(element.get(RELATIONSHIP_ID)), element.get("location")
+                for row in range(min_row, max_row + 1):
+                    for column in range(min_col - 1, max_col):
+                        hyperlinks.setdefault(row, {})[column] = link
+            elif element.tag == f"{SHEET_NAMESPACE}row":
+                element.clear()
+    return hyperlinks
+
+
+def iter_xlsx_rows_with_hyperlinks(file_path: str) -> Iterator[Tuple[list, Dict[int, Tuple[str, str]]]]:
+    """
+    Read the first sheet of an xlsx file in the read-only (streaming) mode together with the hyperlinks.
+    Yields (values, hyperlinks of the row: index of the column from 0 -> (target, location)).
+    The values are the same as in load_workbook: the rows are padded to the width of the header,
+    an empty cell with a hyperlink gets its target (or location) as the value.
+    """
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        ws = wb[wb.sheetnames[0]]
+        # The hyperlinks are at the end of the sheet, so they are read before the rows.
+        hyperlinks: Dict[int, Dict[int, Tuple[str, str]]] = read_hyperlinks(wb._archive, ws._worksheet_path)
+        ws.reset_dimensions()
+        width: Optional[int] = None
+        for row_number, row in enumerate(ws.iter_rows(values_only=True), 1):
+            row: list = list(row)
+            if width is None:
+                width = len(row)
+            elif len(row) < width:
+                row.extend([None] * (width - len(row)))
+            row_hyperlinks: Dict[int, Tuple[str, str]] = hyperlinks.pop(row_number, {})
+            for column, (target, location) in row_hyperlinks.items():
+                if column < len(row) and row[column] is None:
+                    row[column] = target or location
+            yield row, row_hyperlinks
+    finally:
+        wb.close()
+
+
+def get_csv_debug_path(file_path: str) -> str:
+    """
+    Path of the debug csv copy: <folder>/csv/<file>.csv.
+    """
+    csv_path: str = os.path.join(os.path.dirname(file_path), "csv")
+    os.makedirs(csv_path, exist_ok=True)
+    return os.path.join(csv_path, f"{os.path.basename(file_path)}.csv")
+
+
+def read_rows(file_path: str, csv_debug: Optional[bool] = None) -> Iterator[List[str]]:
+    """
+    Read rows of xls, xlsx or csv file as lists of strings, the same as csv.reader over the output of in2csv.
+    The first row is the header.
+    """
+    file_format: str = get_file_format(file_path)
+    if file_format == "csv":
+        with open(file_path, newline='') as csvfile:
+            yield from csv.reader(csvfile)
+        return
+    rows: Iterator = iter_xls_rows(file_path) if file_format == "xls" else iter_xlsx_rows(file_path)
+    if csv_debug is None:
+        csv_debug = CSV_DEBUG
+    debug_file = open(get_csv_debug_path(file_path), "w", newline='') if csv_debug else None
+    try:
+        writer = csv.writer(debug_file, lineterminator="\n") if debug_file else None
+        width: Optional[int] = None
+        for row in rows:
+            row: List[str] = [format_cell(value) for value in row]
+            if width is None:
+                row = get_header(row)
+                width = len(row)
+            elif len(row) < width:
+                row.extend([""] * (width - len(row)))
+            if writer:
+                writer.writerow(row)
+            yield row
+    finally:
+        if debug_file:
+            debug_file.close()
+
+
+def read_dicts(file_path: str) -> Iterator[dict]:
+    """
+    Read rows as dictionaries, the same as csv.DictReader.
+    """
+    if get_file_format(file_path) == "csv":
+        with open(file_path, newline='') as csvfile:
+            yield from csv.DictReader(csvfile)
+        return
+    rows: Iterator[List[str]] = read_rows(file_path)
+    header: Optional[List[str]] = next(rows, None)
+    if header is None:
+        return
+    for row in rows:
+        yield dict(zip(header, row))
+
+
+def read_dataframe(file_path: str, dtype: Optional[type] = None) -> pd.DataFrame:
+    """
+    Read the file into a DataFrame, the same as pd.read_csv over the output of in2csv.
+    Only dtype=str (keep strings) and dtype=None (infer numeric columns) are supported.
+    """
+    if get_file_format(file_path) == "csv":
+        return pd.read_csv(file_path, dtype=dtype)
+    rows: Iterator[List[str]] = read_rows(file_path)
+    header: List[str] = next(rows, [])
+    df: pd.DataFrame = pd.DataFrame(list(rows), columns=header, dtype=object).replace({"": np.nan})
+    return df.apply(pd.to_numeric, errors="ignore") if dtype is None else df
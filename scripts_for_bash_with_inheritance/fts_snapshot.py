@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import mmap
+import fcntl
+import app_logger
+from __init__ import *
+from datetime import datetime
+from clickhouse_client import get_clickhouse_client
+from clickhouse_connect.driver import Client
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+SNAPSHOT_FOLDER: str = os.path.join(os.environ.get("XL_IDP_PATH_REFERENCE_SCRIPTS", "."), "cache")
+# Rows of fts with this column greater than the saved watermark are added on the refresh.
+WATERMARK_COLUMN: str = os.environ.get("REFERENCE_FTS_WATERMARK_COLUMN", "original_file_parsed_on")
+
+# Files with fewer distinct INNs are checked by queries to fts instead of the snapshot.
+LOOKUP_THRESHOLD: int = int(os.environ.get("REFERENCE_FTS_LOOKUP_THRESHOLD", 2000))
+LOOKUP_CHUNK_SIZE: int = int(os.environ.get("REFERENCE_FTS_LOOKUP_CHUNK_SIZE", 500))
+
+# The sender's INN takes precedence over the recipient's one, as in {**fts_recipients_inn, **fts_senders_inn}.
+RECIPIENT: int = 0
+SENDER: int = 1
+
+logger: app_logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.now().date()))
+
+
+def get_fts_client() -> Client:
+    return get_clickhouse_client(database="fts")
+
+
+def iter_entries(rows: Iterable[tuple]) -> Iterator[Tuple[str, int, Optional[str]]]:
+    """
+    Rows (recipients_tin, senders_tin, name_of_the_contract_holder) -> (inn, source, name).
+    """
+    for recipient_inn, sender_inn, name in rows:
+        if recipient_inn:
+            yield recipient_inn, RECIPIENT, name
+        if sender_inn:
+            yield sender_inn, SENDER, name
+
+
+def merge_entries(entries: Iterable[Tuple[str, int, Optional[str]]]) -> Dict[str, Tuple[int, Optional[str]]]:
+    """
+    INN -> (source, name). The later entry replaces the earlier one unless it is a recipient and the earlier is a sender.
+    """
+    merged: Dict[str, Tuple[int, Optional[str]]] = {}
+    for inn, source, name in entries:
+        if inn not in merged or source >= merged[inn][0]:
+            merged[inn] = source, name
+    return merged
+
+
+def encode_line(inn: str, source: int, name: Optional[str]) -> bytes:
+    return f"{inn}\t{source}\t{json.dumps(name, ensure_ascii=False)}\n".encode("utf-8")
+
+
+def decode_line(line: bytes) -> Tuple[str, int, Optional[str]]:
+    inn, source, name = line.decode("utf-8").split("\t", 2)
+    return inn, int(source), json.loads(name)
+
+
+def lookup_inns(client: Client, inns: Iterable[str], chunk_size: int = LOOKUP_CHUNK_SIZE) -> Dict[str, Optional[str]]:
+    """
+    Get INN -> name_of_the_contract_holder only for these INNs with chunked IN queries to fts.
+    The precedence of the sender's INN is the same as in the snapshot.
+    """
+    inns = sorted({inn for inn in inns if inn})
+    query: str = "SELECT DISTINCT recipients_tin, senders_tin, name_of_the_contract_holder FROM fts " \
+                 "WHERE recipients_tin IN %(inns)s OR senders_tin IN %(inns)s"
+    entries: list = []
+    for start in range(0, len(inns), chunk_size):
+        rows = client.query(query, parameters={"inns": tuple(inns[start:start + chunk_size])}).result_rows
+        entries.extend(iter_entries(rows))
+    requested: set = set(inns)
+    merged: Dict[str, Tuple[int, Optional[str]]] = merge_entries(entry for entry in entries if entry[0] in requested)
+    logger.info(f"Found {len(merged)} of {len(inns)} INNs in fts")
+    return {inn: name for inn, (_, name) in merged.items()}
+
+
+class FtsSnapshot(object):
+    def __init__(self, folder: str = SNAPSHOT_FOLDER):
+        """
+        INN -> name_of_the_contract_holder from fts, saved on disk.
+        The data file contains lines "inn<TAB>source<TAB>name as json" sorted by INN. It is memory-mapped,
+        and INNs are found by binary search, so the snapshot is not loaded into memory.
+        :param folder: Folder of the snapshot files.
+        """
+        self.data_path: str = os.path.join(folder, "fts_inn.snapshot")
+        self.meta_path: str = os.path.join(folder, "fts_inn.json")
+        self.lock_path: str = os.path.join(folder, "fts_inn.lock")
+        os.makedirs(folder, exist_ok=True)
+        self.file = None
+        self.mm: Optional[mmap.mmap] = None
+
+    def __enter__(self) -> "FtsSnapshot":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def get_meta(self) -> dict:
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.data_path):
+            return {}
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def write(self, entries: Iterable[Tuple[str, int, Optional[str]]], meta: dict) -> None:
+        """
+        Write the sorted entries into a new file and replace the snapshot with it.
+        """
+        tmp_path: str = f"{self.data_path}.tmp"
+        count: int = 0
+        with open(tmp_path, "wb") as f:
+            for inn, source, name in entries:
+                f.write(encode_line(inn, source, name))
+                count += 1
+        os.replace(tmp_path, self.data_path)
+        meta["count"] = count
+        with open(f"{self.meta_path}.tmp", "w") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=4)
+        os.replace(f"{self.meta_path}.tmp", self.meta_path)
+        logger.info(f"Snapshot of fts is written. Meta is {meta}")
+
+    def iter_snapshot(self) -> Iterator[Tuple[str, int, Optional[str]]]:
+        if not os.path.exists(self.data_path):
+            return
+        with open(self.data_path, "rb") as f:
+            for line in f:
+                yield decode_line(line)
+
+    @staticmethod
+    def merge_sorted(old: Iterator[Tuple[str, int, Optional[str]]],
+                     new: Dict[str, Tuple[int, Optional[str]]]) -> Iterator[Tuple[str, int, Optional[str]]]:
+        """
+        Merge the sorted entries of the snapshot with the new entries (the precedence is the same as in merge_entries).
+        """
+        new_inns: list = sorted(new, key=lambda inn: inn.encode("utf-8"))
+        index: int = 0
+        for inn, source, name in old:
+            while index < len(new_inns) and new_inns[index].encode("utf-8") < inn.encode("utf-8"):
+                yield (new_inns[index], *new[new_inns[index]])
+                index += 1
+            if index < len(new_inns) and new_inns[index] == inn:
+                if new[inn][0] >= source:
+                    source, name = new[inn]
+                index += 1
+            yield inn, source, name
+        for inn in new_inns[index:]:
+            yield (inn, *new[inn])
+
+    def reload(self, client: Client) -> None:
+        """
+        Download the whole fts table and rebuild the snapshot.
+        """
+        watermark = client.query(f"SELECT max({WATERMARK_COLUMN}) FROM fts").result_rows[0][0]
+        query: str = "SELECT DISTINCT recipients_tin, senders_tin, name_of_the_contract_holder FROM fts " \
+                     f"WHERE {WATERMARK_COLUMN} <= %(watermark)s"
+        with client.query_row_block_stream(query, parameters={"watermark": watermark}) as stream:
+            merged: Dict[str, Tuple[int, Optional[str]]] = merge_entries(
+                entry for block in stream for entry in iter_entries(block)
+            )
+        inns: list = sorted(merged, key=lambda inn: inn.encode("utf-8"))
+        self.write(((inn, *merged[inn]) for inn in inns), {"watermark": str(watermark), "full_reload": True})
+
+    def update(self, client: Client) -> None:
+        """
+        Add only the rows of fts which appeared after the watermark.
+        """
+        meta: dict = self.get_meta()
+        watermark = client.query(f"SELECT max({WATERMARK_COLUMN}) FROM fts").result_rows[0][0]
+        if str(watermark) == meta["watermark"]:
+            logger.info(f"Snapshot of fts is up to date. Watermark is {watermark}")
+            return
+        query: str = "SELECT DISTINCT recipients_tin, senders_tin, name_of_the_contract_holder FROM fts " \
+                     f"WHERE {WATERMARK_COLUMN} > %(old_watermark)s AND {WATERMARK_COLUMN} <= %(watermark)s"
+        rows = client.query(query, parameters={"old_watermark": meta["watermark"], "watermark": watermark}).result_rows
+        new: Dict[str, Tuple[int, Optional[str]]] = merge_entries(iter_entries(rows))
+        logger.info(f"Got {len(rows)} new rows of fts after {meta['watermark']}")
+        self.write(self.merge_sorted(self.iter_snapshot(), new), {"watermark": str(watermark), "full_reload": False})
+
+    def refresh(self, client: Client, full_reload: bool = False) -> None:
+        """
+        Update the snapshot. The whole table is downloaded only on demand or if there is no snapshot yet.
+        """
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if full_reload or not self.get_meta():
+                self.reload(client)
+            else:
+                self.update(client)
+
+    def open(self) -> "FtsSnapshot":
+        self.close()
+        self.file = open(self.data_path, "rb")
+        if os.fstat(self.file.fileno()).st_size:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def close(self) -> None:
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __len__(self) -> int:
+        return self.get_meta().get("count", 0)
+
+    def find(self, inn: str) -> Optional[Tuple[str, int, Optional[str]]]:
+        """
+        Binary search of the line with the INN.
+        """
+        if self.mm is None or not inn:
+            return None
+        key: bytes = f"{inn}\t".encode("utf-8")
+        low, high = 0, len(self.mm)
+        # Invariant: the line starting at `low` (or after it) is the first line which can have key >= inn.
+        while low < high:
+            middle: int = (low + high) // 2
+            start: int = self.mm.rfind(b"\n", 0, middle) + 1
+            end: int = self.mm.find(b"\n", start)
+            if self.mm[start:end + 1] < key:
+                low = end + 1
+            else:
+                high = start
+        if self.mm[low:low + len(key)] == key:
+            return decode_line(self.mm[low:self.mm.find(b"\n", low) + 1])
+        return None
+
+    def __contains__(self, inn: str) -> bool:
+        return self.find(inn) is not None
+
+    def __getitem__(self, inn: str) -> Optional[str]:
+        entry: Optional[Tuple[str, int, Optional[str]]] = self.find(inn)
+        if entry is None:
+            raise KeyError(inn)
+        return entry[2]
+
+    def get(self, inn: str, default: Optional[str] = None) -> Optional[str]:
+        entry: Optional[Tuple[str, int, Optional[str]]] = self.find(inn)
+        return default if entry is None else entry[2]
+
+
+if __name__ == "__main__":
+    # python3 fts_snapshot.py --full - download the whole fts table again.
+    client: Client = get_fts_client()
+    FtsSnapshot().refresh(client, full_reload="--full" in sys.argv[1:])
+    client.close()
@@ -0,0 +1,102 @@
+import os
+import json
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, TextIO
+
+# pretty - array with indent=4 (the same bytes as json.dump(data, f, ensure_ascii=False, indent=4)),
+# compact - array without indents, ndjson - one record per line.
+JSON_FORMATS: tuple = ("pretty", "compact", "ndjson")
+JSON_FORMAT: str = os.environ.get("REFERENCE_JSON_FORMAT", "pretty")
+
+
+class JsonWriter(object):
+    def __init__(self, output_file_path: str, json_format: Optional[str] = None, default: Optional[Callable] = None):
+        """
+        Write records to json one at a time, so the whole dataset is not kept in memory.
+        The data is written into a hidden temporary file which is renamed only when all records are written,
+        so a half-written file never gets into the json folder.
+        :param output_file_path: Path of the json file.
+        :param json_format: pretty, compact or ndjson. By default, REFERENCE_JSON_FORMAT (pretty).
+        :param default: Function for objects which json can't serialize, the same as in json.dump.
+        """
+        self.output_file_path: str = output_file_path
+        self.json_format: str = json_format or JSON_FORMAT
+        if self.json_format not in JSON_FORMATS:
+            raise ValueError(f"Unknown json format {self.json_format}. Expected one of {JSON_FORMATS}")
+        self.default: Optional[Callable] = default
+        self.tmp_file_path: str = os.path.join(
+            os.path.dirname(output_file_path), f".{os.path.basename(output_file_path)}.part"
+        )
+        self.file: Optional[TextIO] = None
+        self.count: int = 0
+
+    def __enter__(self) -> "JsonWriter":
+        self.file = open(self.tmp_file_path, 'w', encoding='utf-8')
+        if self.json_format != "ndjson":
+            self.file.write("[")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is not None:
+            self.file.close()
+            os.remove(self.tmp_file_path)
+            return
+        if self.json_format == "pretty" and self.count:
+            self.file.write("\n]")
+        elif self.json_format != "ndjson":
+            self.file.write("]")
+        self.file.close()
+        os.replace(self.tmp_file_path, self.output_file_path)
+
+    def encode(self, record) -> str:
+        if self.json_format == "pretty":
+            return json.dumps(record, ensure_ascii=False, indent=4, default=self.default).replace("\n", "\n    ")
+        return json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=self.default)
+
+    def write(self, record) -> None:
+        """
+        Write one record.
+        """
+        data: str = self.encode(record)
+        if self.json_format == "ndjson":
+            self.file.write(f"{data}\n")
+        elif self.json_format == "pretty":
+            self.file.write(f"{',' if self.count else ''}\n    {data}")
+        else:
+            self.file.write(f"{',' if self.count else ''}{data}")
+        self.count += 1
+
+    def write_all(self, records: Iterable) -> int:
+        """
+        Write all records from a list or a generator.
+        :return: Number of written records.
+        """
+        for record in records:
+            self.write(record)
+        return self.count
+
+
+def write_json(output_file_path: str, records: Iterable, json_format: Optional[str] = None,
+               default: Optional[Callable] = None) -> int:
+    """
+    Write records from a list or a generator to the json file.
+    :return: Number of written records.
+    """
+    with JsonWriter(output_file_path, json_format, default) as writer:
+        return writer.write_all(records)
+
+
+def write_json_chunks(output_file_prefix: str, records: Iterable, chunk_size: int, json_format: Optional[str] = None,
+                      default: Optional[Callable] = None) -> List[str]:
+    """
+    Write records into files of chunk_size records: <prefix>_part_1.json, <prefix>_part_2.json, ...
+    :return: Paths of the written files.
+    """
+    records: Iterator = iter(records)
+    paths: List[str] = []
+    while True:
+        chunk: list = list(islice(records, chunk_size))
+        if not chunk:
+            return paths
+        paths.append(f"{output_file_prefix}_part_{len(paths) + 1}.json")
+        write_json(paths[-1], chunk, json_format, default)
@@ -0,0 +1,57 @@
+import re
+from fuzzywuzzy import fuzz
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+PUNCTUATION: str = r",'!@#$%^&*()[]{};<>?\|`~=_+"
+MULTIPLE_SPACES: re.Pattern = re.compile(" +")
+# In the unified name the punctuation is replaced with spaces, in the name from the file it is removed.
+UNIFIED_TABLE: dict = str.maketrans({c: " " for c in PUNCTUATION})
+NAME_TABLE: dict = str.maketrans("", "", PUNCTUATION)
+
+# Pairs are scored in chunks of this size when several processes are used.
+CHUNK_SIZE: int = 2000
+
+
+def normalize_unified(name: str) -> str:
+    return MULTIPLE_SPACES.sub(" ", name.upper()).translate(UNIFIED_TABLE).upper()
+
+
+def normalize_name(name: str) -> str:
+    return MULTIPLE_SPACES.sub(" ", name).translate(NAME_TABLE).upper()
+
+
+def score_chunk(pairs: List[Tuple[str, str]]) -> List[int]:
+    return [fuzz.partial_ratio(unified, name) for unified, name in pairs]
+
+
+def score_pairs(pairs: Iterable[Tuple[str, str]], processes: int = 1) -> List[int]:
+    """
+    Score all pairs (unified name, name) with fuzz.partial_ratio after the normalization.
+    With processes > 1 the chunks of pairs are scored in a process pool. If the pool can't be started
+    (e.g. inside a daemonic worker process), the pairs are scored in the current process.
+    """
+    pairs = [(normalize_unified(unified), normalize_name(name)) for unified, name in pairs]
+    if processes <= 1 or len(pairs) <= CHUNK_SIZE:
+        return score_chunk(pairs)
+    chunks: List[List[Tuple[str, str]]] = [pairs[i:i + CHUNK_SIZE] for i in range(0, len(pairs), CHUNK_SIZE)]
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            return [score for chunk in executor.map(score_chunk, chunks) for score in chunk]
+    except (AssertionError, OSError):
+        return score_chunk(pairs)
+
+
+def score_names(unified_names: List[Optional[str]], names: List[Optional[str]], processes: int = 1) \
+        -> List[Optional[int]]:
+    """
+    Score the columns of names. The score is None if the unified name is empty or the name is None.
+    """
+    indexes: List[int] = [
+        i for i, (unified, name) in enumerate(zip(unified_names, names)) if unified and name is not None
+    ]
+    scores: List[int] = score_pairs(((unified_names[i], names[i]) for i in indexes), processes)
+    result: List[Optional[int]] = [None] * len(names)
+    for i, score in zip(indexes, scores):
+        result[i] = score
+    return result
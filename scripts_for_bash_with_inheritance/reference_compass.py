@@ -1,19 +1,19 @@
+import csv
 import sys
-import json
 import warnings
 import app_logger
 import contextlib
-import pandas as pd
 from __init__ import *
-from typing import Optional
-from requests import Response
+from service_inn import DailyBudget, RequestLimitExceeded, ServiceInnClient, get_cache
+from typing import Dict, List, Optional, Tuple, Union
 from datetime import datetime
 from dotenv import load_dotenv
-from validate_inn import is_valid
-from clickhouse_connect import get_client
+from validate_inn import validate_many
+from date_parser import parse_dates
+from clickhouse_sink import write_output
+from clickhouse_client import get_clickhouse_client
 from clickhouse_connect.driver import Client
-from openpyxl import Workbook, load_workbook
-from openpyxl.worksheet.worksheet import Worksheet
+from excel_reader import iter_xlsx_rows_with_hyperlinks
 
 load_dotenv()
 
@@ -27,6 +27,11 @@ DATE_FORMATS: list = [
 
 list_join_columns: list = ["telephone_number", "email"]
 
+# Number of INNs in one SELECT ... IN and DELETE ... IN query.
+DELETE_CHUNK_SIZE: int = int(os.environ.get("REFERENCE_COMPASS_DELETE_CHUNK_SIZE", 1000))
+# Rejected rows are written to <file>_error.csv by chunks of this size.
+ERROR_CHUNK_SIZE: int = int(os.environ.get("REFERENCE_COMPASS_ERROR_CHUNK_SIZE", 10000))
+
 logger: app_logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.now().date()))
 
 headers_eng: dict = {
@@ -73,6 +78,14 @@ headers_eng: dict = {
     ("Филиалы",): "branch_name"
 }
 
+# Name of the column in the file (Russian or English) -> English name of the column.
+HEADER_LOOKUP: Dict[str, str] = {
+    **{column_rus: columns_eng for key, columns_eng in headers_eng.items() for column_rus in key},
+    **{columns_eng: columns_eng for columns_eng in headers_eng.values()},
+    'original_file_name': 'original_file_name',
+    'original_file_parsed_on': 'original_file_parsed_on'
+}
+
 
 # def get_my_env_var(var_name: str) -> str:
 #     try:
@@ -85,12 +98,56 @@ headers_eng: dict = {
 #     pass
 
 
+class ErrorCollector(object):
+    def __init__(self, file_path: str, original_columns: dict, chunk_size: int = ERROR_CHUNK_SIZE):
+        """
+        Rows rejected by the parser with the reason. They are buffered and appended to the csv file by chunks.
+        :param file_path: Path of the csv file.
+        :param original_columns: English name -> name of the column in the file, for the header.
+        :param chunk_size: Number of rows in the buffer.
+        """
+        self.file_path: str = file_path
+        self.original_columns: dict = original_columns
+        self.chunk_size: int = chunk_size
+        self.header: Optional[List[str]] = None
+        self.rows: List[list] = []
+
+    def add(self, dict_data: dict, error: str) -> None:
+        """
+        Add the columns of the row before original_file_name, the first column is the error.
+        """
+        columns: List[str] = list(dict_data)
+        columns = columns[:columns.index('original_file_name')]
+        if self.header is None:
+            self.header = ['Ошибки'] + [self.original_columns.get(column, column) for column in columns]
+        self.rows.append([error] + [dict_data[column] for column in columns])
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Append the buffered rows. The header is written only into an empty file.
+        """
+        if not self.rows:
+            return
+        with open(self.file_path, 'a', newline='') as f:
+            writer = csv.writer(f, lineterminator="\n")
+            if f.tell() == 0:
+                writer.writerow(self.header)
+            writer.writerows(self.rows)
+        self.rows.clear()
+
+
 class ReferenceCompass(object):
     def __init__(self, input_file_path: str, output_folder: str):
         self.table_name: str = "cache_dadata"
         self.input_file_path: str = input_file_path
         self.output_folder: str = output_folder
         self.original_columns: dict = {}
+        self.errors: ErrorCollector = ErrorCollector(
+            f"{os.path.dirname(self.input_file_path)}/{os.path.basename(self.input_file_path)}_error.csv",
+            self.original_columns
+        )
 
     @staticmethod
     def connect_to_db() -> Client:
@@ -98,8 +155,7 @@ class ReferenceCompass(object):
         Connecting to clickhouse.
         """
         try:
-            client: Client = get_client(host=get_my_env_var('HOST'), database=get_my_env_var('DATABASE'),
-                                        username=get_my_env_var('USERNAME_DB'), password=get_my_env_var('PASSWORD'))
+            client: Client = get_clickhouse_client()
             client.query("SET allow_experimental_lightweight_delete=1")
         except Exception as ex_connect:
             logger.error(f"Error connection to db {ex_connect}. Type error is {type(ex_connect)}.")
@@ -108,20 +164,40 @@ class ReferenceCompass(object):
             sys.exit(1)
         return client
 
+    @staticmethod
+    def delete_inns(client: Client, inns: List[str]) -> None:
+        """
+        Delete the rows with these INNs from the database with one query for the check and one mutation.
+        """
+        parameters: dict = {"inns": tuple(inns)}
+        query: str = "SELECT DISTINCT inn FROM reference_compass WHERE inn IN %(inns)s"
+        if client.query(query, parameters=parameters).result_rows:
+            client.command("DELETE FROM reference_compass WHERE inn IN %(inns)s", parameters=parameters)
+
     def change_data_in_db(self, parsed_data: list) -> None:
         """
         Delete the data from the database if the row is loaded now.
+        INNs are deleted in chunks. If the chunk fails, its INNs are deleted one by one to find the failed rows.
         """
         client = self.connect_to_db()
-        parsed_data_copy: list = parsed_data.copy()
-        for dict_data in parsed_data_copy:
-            for key, value in dict_data.items():
-                if key in ["inn"]:
-                    try:
-                        for _ in client.query(f"SELECT * FROM reference_compass WHERE inn='{value}'").result_rows:
-                            client.query(f"DELETE FROM reference_compass WHERE inn='{value}'")
-                        break
-                    except Exception as ex_db:
+        rows_by_inn: Dict[str, List[dict]] = {}
+        for dict_data in parsed_data:
+            if dict_data.get("inn") is not None:
+                rows_by_inn.setdefault(dict_data["inn"], []).append(dict_data)
+        inns: List[str] = list(rows_by_inn)
+        for start in range(0, len(inns), DELETE_CHUNK_SIZE):
+            chunk: List[str] = inns[start:start + DELETE_CHUNK_SIZE]
+            try:
+                self.delete_inns(client, chunk)
+                continue
+            except Exception as ex_db:
+                logger.error(f"Failed to delete {len(chunk)} INNs. Error is {ex_db}. Type error is {type(ex_db)}. "
+                             f"Deleting them one by one")
+            for inn in chunk:
+                try:
+                    self.delete_inns(client, [inn])
+                except Exception as ex_db:
+                    for dict_data in rows_by_inn[inn]:
                         logger.error(f"Failed to execute action. Error is {ex_db}. Type error is {type(ex_db)}. "
                                      f"Data is {dict_data}")
                         telegram(
@@ -134,66 +210,83 @@ class ReferenceCompass(object):
     def leave_largest_data_with_dupl_inn(parsed_data: list) -> list:
         """
         Leave the rows with the largest amount of data with repeated INN.
+        The row which replaces the previous one is moved to the end, as before.
         """
-        uniq_parsed_parsed_data: list = []
+        uniq_parsed_data: Dict[str, Tuple[dict, int]] = {}
         for d in parsed_data:
-            if [cache for cache in uniq_parsed_parsed_data if d["inn"] == cache["inn"]]:
-                index_dupl: int = uniq_parsed_parsed_data.index(next(filter(lambda n: n.get('inn') == d["inn"],
-                                                                            uniq_parsed_parsed_data)))
-                if len([x for x in list(d.values()) if x is not None]) > \
-                        len([x for x in uniq_parsed_parsed_data[index_dupl].values() if x is not None]):
-                    uniq_parsed_parsed_data.pop(index_dupl)
-                    uniq_parsed_parsed_data.append(d)
-            else:
-                uniq_parsed_parsed_data.append(d)
-        return uniq_parsed_parsed_data
+            count_values: int = sum(value is not None for value in d.values())
+            cached: Optional[Tuple[dict, int]] = uniq_parsed_data.get(d["inn"])
+            if cached is None:
+                uniq_parsed_data[d["inn"]] = d, count_values
+            elif count_values > cached[1]:
+                del uniq_parsed_data[d["inn"]]
+                uniq_parsed_data[d["inn"]] = d, count_values
+        return [d for d, _ in uniq_parsed_data.values()]
 
-    def get_data_from_cache(self, dict_data: dict, index: int):
+    def get_data_from_cache(self, dict_data: dict, index: int,
+                            response: Union[list, requests.exceptions.RequestException]) -> None:
         """
         Get data from the cache in order not to go to dadata again, because the limit is 10000 requests per day.
         """
-        self.get_data_from_service_inn(dict_data, index)
+        self.get_data_from_service_inn(dict_data, index, response)
         if not dict_data["dadata_branch_name"] \
                 and not dict_data["dadata_branch_address"] and not dict_data["dadata_branch_region"]:
             dict_data["dadata_branch_name"] = None
             dict_data["dadata_branch_address"] = None
             dict_data["dadata_branch_region"] = None
 
-    @staticmethod
-    def convert_format_date(date: str) -> Optional[str]:
-        """
-        Convert to a date type.
-        """
-        for date_format in DATE_FORMATS:
-            with contextlib.suppress(ValueError):
-                return str(datetime.strptime(date, date_format).date())
-        return None
+    def check_daily_limit(self, responses: dict) -> None:
+        """
+        Stop the file if some INNs were not requested because the daily limit of dadata is exhausted.
+        The file is moved to error_code_dadata_limit_exceeded_... and can be loaded again on the next day,
+        the INNs which were got today are taken from the local cache then.
+        """
+        not_requested: int = sum(isinstance(response, RequestLimitExceeded) for response in responses.values())
+        if not_requested:
+            logger.error(f"Error code: the daily limit of dadata is exceeded. INNs not requested: {not_requested}")
+            print("dadata_limit_exceeded", file=sys.stderr)
+            telegram(f'Превышен дневной лимит запросов к DaData. Файл {self.input_file_path} не загружен, '
+                     f'ИНН без данных: {not_requested}')
+            sys.exit(2)
 
     def handle_raw_data(self, parsed_data: list) -> None:
         """
         Change data types or changing values.
+        Data from service_inn is requested concurrently for all valid rows and then applied row by row in the same order.
         """
+        valid_inns, _ = validate_many([dict_data.get('inn') for dict_data in parsed_data])
+        registration_dates: List[Optional[str]] = parse_dates(
+            [dict_data.get("registration_date") for dict_data in parsed_data], DATE_FORMATS, lambda date: str(date.date())
+        )
+        rows_to_enrich: List[Tuple[dict, int]] = []
         for index in range(len(parsed_data) - 1, -1, -1):  # Итерация с конца списка
             dict_data = parsed_data[index]
-            logger.info(f"Processing in row {index + 2}. INN is {dict_data['inn']}. Data is {dict_data}")
+            logger.info("Processing in row %s. INN is %s. Data is %s", index + 2, dict_data['inn'], dict_data,
+                        extra=app_logger.SAMPLE_ROWS)
             self.add_new_columns(dict_data)
 
             for key, value in dict_data.items():
                 with contextlib.suppress(Exception):
                     if key == 'inn':
-                        logger.info(f"INN - {value}. Index - {index + 2}")
-                        if not is_valid(value):
+                        logger.info("INN - %s. Index - %s", value, index + 2, extra=app_logger.SAMPLE_ROWS)
+                        if not valid_inns[index]:
                             self.save_to_csv(dict_data, "Неправильный ИНН")
                             del parsed_data[index]  # Удаляем текущий элемент
                             break
                     elif key == "registration_date":
-                        dict_data[key] = self.convert_format_date(value) if value else None
+                        dict_data[key] = registration_dates[index] if value else None
                     elif key in ["revenue_at_upload_date_thousand_rubles", "employees_number_at_upload_date",
                                  "net_profit_or_loss_at_upload_date_thousand_rubles"]:
                         dict_data[key] = int(value) if value.isdigit() else None
             else:
-                # Только если не было break в предыдущем цикле, вызываем метод для получения данных из кеша
-                self.get_data_from_cache(dict_data, index + 2)
+                # Только если не было break в предыдущем цикле, получаем данные из кеша
+                rows_to_enrich.append((dict_data, index + 2))
+        with get_cache() as cache, DailyBudget() as budget, \
+                ServiceInnClient(budget=budget, cache=cache) as service_inn:
+            responses: dict = service_inn.fetch_many(dict_data["inn"] for dict_data, _ in rows_to_enrich)
+        self.check_daily_limit(responses)
+        for dict_data, index in rows_to_enrich:
+            self.get_data_from_cache(dict_data, index, responses[dict_data["inn"]])
 
     def add_new_columns(self, dict_data: dict) -> None:
         """
@@ -276,7 +369,8 @@ class ReferenceCompass(object):
                 if company_data and company_data["state"]["status"] != "LIQUIDATED":
                     self.add_dadata_columns(company_data, company_address, company_address_data, company_data_branch,
                                             company, dict_data, dadata_request[1])
-                logger.info(f"Processed in row {index}. INN is {dict_data['inn']}. Data is {dict_data}")
+                logger.info("Processed in row %s. INN is %s. Data is %s", index, dict_data['inn'], dict_data,
+                            extra=app_logger.SAMPLE_ROWS)
             except Exception as ex_parse:
                 logger.error(
                     f"Error code: error processing in row {index}! Error is {ex_parse}. Data is {dict_data}"
@@ -284,84 +378,71 @@ class ReferenceCompass(object):
                 telegram(f'Ошибка в строке {index}, ИНН - {dict_data["inn"]}, Файл: {self.input_file_path}')
                 self.save_to_csv(dict_data, str(ex_parse))
 
-    def get_data_from_service_inn(self, dict_data: dict, index: int) -> None:
+    def get_data_from_service_inn(self, dict_data: dict, index: int,
+                                  response: Union[list, requests.exceptions.RequestException]) -> None:
         """
-        Connect to dadata.
+        Add data from the response of service_inn (dadata).
         """
-        data: dict = {
-            "inn": dict_data["inn"]
-        }
-        try:
-            response: Response = requests.post("http://service_inn:8003", json=data)
-            response.raise_for_status()
-            self.get_data_from_dadata(response.json(), dict_data, index)
-        except requests.exceptions.RequestException as e:
-            logger.error(f"An error occurred during the API request: {str(e)}")
+        if isinstance(response, requests.exceptions.RequestException):
+            logger.error(f"An error occurred during the API request: {str(response)}")
+            return
+        self.get_data_from_dadata(response, dict_data, index)
 
     def save_to_csv(self, dict_data: dict, error: str) -> None:
-        df: pd.DataFrame = pd.DataFrame([dict_data])
-        index_of_column: int = df.columns.get_loc('original_file_name')
-        columns_slice: pd.DataFrame = df.iloc[:, :index_of_column]
-        columns_slice.rename(columns=self.original_columns, inplace=True)
-        columns_slice.insert(0, 'Ошибки', error)
-        with open(f"{os.path.dirname(self.input_file_path)}/{os.path.basename(self.input_file_path)}_error.csv", 'a') \
-                as f:
-            columns_slice.to_csv(f, header=f.tell() == 0, index=False)
+        """
+        Save the rejected row into <file>_error.csv (written by chunks and at the end of main).
+        """
+        self.errors.add(dict_data, error)
 
     def write_to_json(self, parsed_data: list) -> None:
         """
-        Write data to json.
+        Write data to json and/or ClickHouse (REFERENCE_OUTPUT).
         """
         basename: str = os.path.basename(self.input_file_path)
         output_file_path: str = os.path.join(self.output_folder, f'{basename}.json')
-        with open(f"{output_file_path}", 'w', encoding='utf-8') as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=4)
-
-    def get_column_eng(self, column: tuple, dict_header: dict) -> None:
-        """
-        Get the English column name.
-        """
-        for cell in column:
-            for key, columns_eng in headers_eng.items():
-                for column_rus in key:
-                    dict_columns_name: dict = {
-                        column_rus: columns_eng,
-                        columns_eng: columns_eng,
-                        'original_file_name': cell.internal_value,
-                        'original_file_parsed_on': cell.internal_value
-                    }
-                    if cell.internal_value in dict_columns_name:
-                        self.original_columns[dict_columns_name[cell.internal_value]] = cell.internal_value
-                        dict_header[cell.column_letter] = cell.internal_value, dict_columns_name[cell.internal_value]
+        write_output(output_file_path, parsed_data, "reference_compass")
+
+    def get_column_eng(self, column: list) -> List[Tuple[int, str, bool]]:
+        """
+        Get the English column names from the header once.
+        :return: (index of the column, English name, whether the values are joined with "/") in the order of columns.
+        """
+        header_columns: List[Tuple[int, str, bool]] = []
+        for index, cell_value in enumerate(column):
+            columns_eng: Optional[str] = HEADER_LOOKUP.get(cell_value)
+            if columns_eng is not None:
+                self.original_columns[columns_eng] = cell_value
+                header_columns.append((index, columns_eng, columns_eng in list_join_columns))
+        return header_columns
 
     @staticmethod
-    def get_value_from_cell(column: tuple, dict_header: dict, dict_columns: dict) -> None:
-        """
-        Get a value from a cell, including url.
-        """
-        for cell in column:
-            for key, value in dict_header.items():
-                if cell.column_letter == key:
-                    try:
-                        if value[1] in list_join_columns and dict_columns.get(value[1]):
-                            dict_columns[value[1]] = f"{dict_columns.get(value[1])}/{cell.value}"
-                            continue
-                        dict_columns[value[1]] = cell.hyperlink.target
-                    except AttributeError:
-                        dict_columns[value[1]] = str(cell.value) if cell.value is not None else cell.value
-
-    def parse_xlsx(self, ws: Worksheet, parsed_data: list) -> None:
-        """
-        Xlsx file parsing.
-        """
-        dict_header: dict = {}
-        for i, column in enumerate(ws):
-            dict_columns: dict = {}
-            if i == 0:
-                self.get_column_eng(column, dict_header)
-                continue
-            self.get_value_from_cell(column, dict_header, dict_columns)
-            parsed_data.append(dict_columns)
+    def get_value_from_cell(column: list, hyperlinks: dict, header_columns: List[Tuple[int, str, bool]]) -> dict:
+        """
+        Get the values of the row by the positions of the columns, including url.
+        :param column: Values of the row.
+        :param hyperlinks: Index of the column -> (target, location) of the hyperlink.
+        :param header_columns: Columns from get_column_eng.
+        """
+        dict_columns: dict = {}
+        for index, columns_eng, is_join_column in header_columns:
+            cell_value = column[index]
+            if is_join_column and dict_columns.get(columns_eng):
+                dict_columns[columns_eng] = f"{dict_columns[columns_eng]}/{cell_value}"
+            elif index in hyperlinks:
+                dict_columns[columns_eng] = hyperlinks[index][0]
+            else:
+                dict_columns[columns_eng] = str(cell_value) if cell_value is not None else cell_value
+        return dict_columns
+
+    def parse_xlsx(self, parsed_data: list) -> None:
+        """
+        Xlsx file parsing. The rows are read as a stream, the hyperlinks are read from the sheet separately.
+        """
+        rows = iter_xlsx_rows_with_hyperlinks(self.input_file_path)
+        header, _ = next(rows, ([], {}))
+        header_columns: List[Tuple[int, str, bool]] = self.get_column_eng(header)
+        for column, hyperlinks in rows:
+            parsed_data.append(self.get_value_from_cell(column, hyperlinks, header_columns))
 
     def main(self) -> None:
         """
@@ -370,23 +451,33 @@ class ReferenceCompass(object):
         with warnings.catch_warnings(record=True):
             warnings.simplefilter("always")
             logger.info(f"Filename is {self.input_file_path}")
-            wb: Workbook = load_workbook(self.input_file_path)
-            ws: Worksheet = wb[wb.sheetnames[0]]
-            parsed_data: list = []
-            self.parse_xlsx(ws, parsed_data)
-            self.handle_raw_data(parsed_data)
-            parsed_data: list = self.leave_largest_data_with_dupl_inn(parsed_data)
-            self.change_data_in_db(parsed_data)
-            self.write_to_json(parsed_data)
+            try:
+                parsed_data: list = []
+                self.parse_xlsx(parsed_data)
+                self.handle_raw_data(parsed_data)
+                parsed_data: list = self.leave_largest_data_with_dupl_inn(parsed_data)
+                self.change_data_in_db(parsed_data)
+                self.write_to_json(parsed_data)
+            finally:
+                # The rejected rows are written on the fatal exit too.
+                self.errors.flush()
             logger.info("The script has completed its work")
 
 
-if __name__ == "__main__":
-    reference_compass: ReferenceCompass = ReferenceCompass(sys.argv[1], sys.argv[2])
+def main(input_file_path: str, output_folder: str) -> None:
+    """
+    Run the parser with the exit codes expected by reference_compass.sh.
+    """
+    reference_compass: ReferenceCompass = ReferenceCompass(input_file_path, output_folder)
     try:
         reference_compass.main()
     except Exception as ex:
         logger.error(f"Error code: unknown error - {ex}!")
         print("unknown_error", file=sys.stderr)
-        telegram(f'Ошибка при обработке файла {sys.argv[1]}, Ошибка: {ex}')
+        telegram(f'Ошибка при обработке файла {input_file_path}, Ошибка: {ex}')
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
+
@@ -0,0 +1,266 @@
+import io
+import time
+import shutil
+import fnmatch
+import traceback
+import app_logger
+import contextlib
+import convert_csv_to_json
+import reference_compass
+import reference_container_type
+import reference_import_tracking
+import reference_lines
+import reference_morservice
+import reference_region
+import reference_tnved
+from __init__ import *
+from datetime import datetime
+from reference_inn import ReferenceInn
+from reference_ref import ReferenceRef
+from reference_spardeck import ReferenceSparDeck
+from reference_report_on_order import ReportOnOrder
+from reference_morservice_all import ReferenceMorService
+from reference_statistics import ReferenceStatistics
+from inotify_simple import INotify, flags
+from reference_scheduler import ReferenceScheduler
+from typing import Callable, Dict, Optional, Tuple, Union
+
+EXCEL_PATTERNS: tuple = ("*.xls*", "*.XLS*")
+EXCEL_AND_XML_PATTERNS: tuple = EXCEL_PATTERNS + ("*.xml",)
+
+# Same as `find ! -newermt '3 seconds ago'` in the bash handlers: the file must not be touched for 3 seconds.
+SETTLE_SECONDS: int = 3
+# A full directory scan is still done from time to time in case an inotify event was missed.
+RESCAN_INTERVAL: int = int(os.environ.get("REFERENCE_RESCAN_INTERVAL", 60))
+WATCH_FLAGS: int = flags.CLOSE_WRITE | flags.MOVED_TO
+# Number of worker processes which handle files of all reference types together.
+MAX_WORKERS: int = int(os.environ.get("REFERENCE_MAX_WORKERS", 4))
+
+logger: app_logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.now().date()))
+
+
+def run_reference_inn(input_file_path: str, output_folder: str) -> None:
+    ReferenceInn(input_file_path, output_folder).main()
+
+
+def run_reference_ref(input_file_path: str, output_folder: str) -> None:
+    ReferenceRef(input_file_path, output_folder).main()
+
+
+def run_reference_spardeck(input_file_path: str, output_folder: str) -> None:
+    ReferenceSparDeck(input_file_path, output_folder).main()
+
+
+def run_reference_morservice_all(input_file_path: str, output_folder: str) -> None:
+    ReferenceMorService(input_file_path, output_folder).main()
+
+
+def run_reference_statistics(input_file_path: str, output_folder: str) -> None:
+    ReferenceStatistics(input_file_path, output_folder).main()
+
+
+def run_reference_report_on_order(input_file_path: str, output_folder: str) -> None:
+    ReportOnOrder(input_file_path, output_folder)()
+
+
+def run_convert_csv_to_json(input_file_path: str, output_folder: str) -> None:
+    convert_csv_to_json.main(input_file_path, os.path.join(output_folder, os.path.basename(input_file_path)))
+
+
+class ReferenceType(object):
+    def __init__(self, run: Callable[[str, str], None], patterns: tuple = EXCEL_PATTERNS,
+                 skip_marker: str = "error_", error_codes: Optional[range] = None, max_concurrency: int = 2):
+        """
+        Description of one reference_* directory, the same as its bash handler.
+        :param run: Function that parses the file and writes json into the output folder.
+        :param patterns: File name patterns to pick up.
+        :param skip_marker: Files with this substring in the name are skipped.
+        :param error_codes: Exit codes which are written into the name of the failed file (error_code_...).
+        :param max_concurrency: How many files of this type can be processed at the same time.
+        """
+        self.run: Callable[[str, str], None] = run
+        self.patterns: tuple = patterns
+        self.skip_marker: str = skip_marker
+        self.error_codes: Optional[range] = error_codes
+        self.max_concurrency: int = max_concurrency
+
+    def is_suitable(self, file_name: str) -> bool:
+        """
+        Check the file name in the same way as `find -name ...` and the error check in bash.
+        """
+        if self.skip_marker in file_name:
+            return False
+        return any(fnmatch.fnmatchcase(file_name, pattern) for pattern in self.patterns)
+
+
+REFERENCE_TYPES: Dict[str, ReferenceType] = {
+    "reference_container_type": ReferenceType(reference_container_type.main),
+    "reference_import_tracking": ReferenceType(reference_import_tracking.main, error_codes=range(1, 10)),
+    "reference_lines": ReferenceType(reference_lines.main),
+    "reference_morservice": ReferenceType(reference_morservice.main),
+    "reference_region": ReferenceType(reference_region.main),
+    "reference_statistics": ReferenceType(run_reference_statistics),
+    "reference_ship": ReferenceType(run_convert_csv_to_json),
+    "reference_is_empty": ReferenceType(run_convert_csv_to_json),
+    # One inn file at a time: every file already runs 10 worker threads and REFERENCE_TRANSLATOR_WORKERS requests
+    # to Google Translate, which blocks bursts of requests from one address.
+    "reference_inn": ReferenceType(run_reference_inn, max_concurrency=1),
+    "reference_tnved2": ReferenceType(reference_tnved.main),
+    # One compass file at a time: every row goes to service_inn and the daily DaData quota is shared.
+    "reference_compass": ReferenceType(reference_compass.main, patterns=EXCEL_AND_XML_PATTERNS, skip_marker="error",
+                                       error_codes=range(1, 3), max_concurrency=1),
+    "reference_morservice_all": ReferenceType(run_reference_morservice_all),
+    "reference_spardeck": ReferenceType(run_reference_spardeck),
+    "reference_ref": ReferenceType(run_reference_ref, patterns=EXCEL_AND_XML_PATTERNS),
+    "reference_report_on_order": ReferenceType(run_reference_report_on_order, patterns=EXCEL_AND_XML_PATTERNS)
+}
+
+
+def run_in_process(run: Callable[[str, str], None], input_file_path: str, output_folder: str) -> Tuple[int, str]:
+    """
+    Run the parser in the current interpreter and return its exit code and stderr like `python3 script.py` would.
+    """
+    stderr: io.StringIO = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            run(input_file_path, output_folder)
+        exit_code: int = 0
+    except SystemExit as ex:
+        if ex.code is None or isinstance(ex.code, int):
+            exit_code = ex.code or 0
+        else:
+            print(ex.code, file=stderr)
+            exit_code = 1
+    except Exception as ex:
+        logger.error(f"Unhandled error in {input_file_path}: {ex}\n{traceback.format_exc()}")
+        exit_code = 1
+    return exit_code, stderr.getvalue().strip()
+
+
+def process_file(name: str, file: str) -> Tuple[int, str, float]:
+    """
+    Worker of the process pool: parse the file of the reference type and write json into the json folder next to it.
+    """
+    started: float = time.monotonic()
+    app_logger.reset_sampling()
+    exit_code, exit_message = run_in_process(REFERENCE_TYPES[name].run, file,
+                                             os.path.join(os.path.dirname(file), "json"))
+    # The worker process can be stopped without atexit, so the logs of the file are written now.
+    app_logger.flush()
+    return exit_code, exit_message, time.monotonic() - started
+
+
+class ReferenceDaemon(object):
+    def __init__(self, root_path: str):
+        self.root_path: str = root_path
+        self.inotify: INotify = INotify()
+        self.watches: Dict[int, str] = {}
+        self.pending: Dict[str, str] = {}
+        self.scheduler: ReferenceScheduler = ReferenceScheduler(
+            process_file, MAX_WORKERS, {name: t.max_concurrency for name, t in REFERENCE_TYPES.items()}
+        )
+        self.queue_depth: Dict[str, Tuple[int, int]] = {}
+
+    @staticmethod
+    def move(file: str, destination: str) -> None:
+        """
+        Move the file in the same way as `mv` (overwrite the destination).
+        """
+        try:
+            shutil.move(file, destination)
+        except OSError as ex:
+            logger.error(f"Failed to move {file} to {destination}. Error is {ex}")
+
+    def handle_result(self, name: str, file: str, result: Union[Tuple[int, str, float], BaseException]) -> None:
+        """
+        Move the processed file to done or error as the bash handlers do.
+        """
+        reference_type: ReferenceType = REFERENCE_TYPES[name]
+        xls_path: str = os.path.join(self.root_path, name)
+        if isinstance(result, BaseException):
+            logger.error(f"Worker failed on {file}. Error is {result}. Type error is {type(result)}")
+            result = 1, "", 0.0
+        exit_code, exit_message, duration = result
+        logger.info(f"File {file} is processed in {duration:.2f} s. Exit code {exit_code}")
+        if exit_code == 0:
+            self.move(file, os.path.join(xls_path, "done", os.path.basename(file)))
+        elif reference_type.error_codes is None:
+            self.move(file, os.path.join(xls_path, f"error_{os.path.basename(file)}"))
+        elif exit_code in reference_type.error_codes:
+            self.move(file, os.path.join(xls_path, f"error_code_{exit_message}_{os.path.basename(file)}"))
+        else:
+            logger.error(f"Unexpected exit code {exit_code} for {file}. The file is left in place")
+
+    def add_pending(self, name: str, file_name: str) -> None:
+        if REFERENCE_TYPES[name].is_suitable(file_name):
+            self.pending[os.path.join(self.root_path, name, file_name)] = name
+
+    def watch(self) -> None:
+        """
+        Create working folders and add inotify watches for every reference_* directory.
+        """
+        for name in REFERENCE_TYPES:
+            xls_path: str = os.path.join(self.root_path, name)
+            for folder in ["done", "json"]:
+                os.makedirs(os.path.join(xls_path, folder), exist_ok=True)
+            self.watches[self.inotify.add_watch(xls_path, WATCH_FLAGS)] = name
+
+    def scan(self) -> None:
+        """
+        Pick up the files which are already in the folders.
+        """
+        for name in REFERENCE_TYPES:
+            xls_path: str = os.path.join(self.root_path, name)
+            with os.scandir(xls_path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        self.add_pending(name, entry.name)
+
+    def process_pending(self) -> None:
+        """
+        Queue the files which have not been changed for SETTLE_SECONDS.
+        """
+        for file, name in list(self.pending.items()):
+            try:
+                modified: float = os.path.getmtime(file)
+            except FileNotFoundError:
+                del self.pending[file]
+                continue
+            if time.time() - modified < SETTLE_SECONDS:
+                continue
+            del self.pending[file]
+            self.scheduler.submit(name, file)
+
+    def log_queue_depth(self) -> None:
+        """
+        Log the number of queued and running files of every reference type when it changes.
+        """
+        queue_depth: Dict[str, Tuple[int, int]] = self.scheduler.get_queue_depth()
+        if queue_depth != self.queue_depth:
+            self.queue_depth = queue_depth
+            logger.info(f"Queue depth (queued, running): {queue_depth}")
+
+    def main(self) -> None:
+        """
+        Wait for the new files and process them without starting a new interpreter.
+        """
+        self.watch()
+        self.scan()
+        logger.info(f"Watching {len(self.watches)} folders in {self.root_path}. Workers: {MAX_WORKERS}")
+        last_scan: float = time.monotonic()
+        while True:
+            for event in self.inotify.read(timeout=1000):
+                if event.wd in self.watches and event.name:
+                    self.add_pending(self.watches[event.wd], event.name)
+            if time.monotonic() - last_scan > RESCAN_INTERVAL:
+                self.scan()
+                last_scan = time.monotonic()
+            self.process_pending()
+            self.scheduler.dispatch()
+            for name, file, result in self.scheduler.collect():
+                self.handle_result(name, file, result)
+            self.log_queue_depth()
+
+
+if __name__ == "__main__":
+    ReferenceDaemon(get_my_env_var('XL_IDP_PATH_REFERENCE')).main()
@@ -1,21 +1,16 @@
 import os
-import csv
 import sys
-import json
-import logging
 import datetime
+import app_logger
 from __init__ import *
 from dotenv import load_dotenv
-from clickhouse_connect import get_client
+from excel_reader import read_dicts
+from json_writer import write_json
+from clickhouse_client import get_clickhouse_client
 
 load_dotenv()
 
-log_dir_name: str = f"{os.environ.get('XL_IDP_PATH_REFERENCE_SCRIPTS')}/logging"
-if not os.path.exists(log_dir_name):
-    os.mkdir(log_dir_name)
-
-logging.basicConfig(filename=f"{log_dir_name}/{os.path.basename(__file__)}.log", level=logging.DEBUG)
-log = logging.getLogger()
+logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.datetime.now().date()))
 
 
 def merge_two_dicts(x, y):
@@ -24,60 +19,77 @@ def merge_two_dicts(x, y):
     return z
 
 
+# Number of row numbers in the exit message, which becomes a part of the name of the error file.
+MAX_ROWS_IN_EXIT_MESSAGE: int = 20
+
+
 class ReferenceImportTracking(object):
 
     @staticmethod
-    def escape_quotes(data: str, sign: str = "'") -> str:
-        return data.replace(f"{sign}", "''") if data.find(f"{sign}") > 0 else data
-
-    def get_field_from_db(self, seaport, country, client, index):
+    def get_regions(client, file_path):
+        """
+        Load all pairs (seaport, country) of reference_region with one query.
+        """
         try:
-            query = client.query(f"SELECT * FROM reference_region WHERE seaport='{self.escape_quotes(seaport)}' "
-                                 f"AND country='{self.escape_quotes(country)}'").result_rows
-            return query
+            return set(client.query("SELECT DISTINCT seaport, country FROM reference_region").result_rows)
         except Exception as ex:
-            logging.error(f"Error getting data from database. Index is {index}. Data is {seaport} and {country}. "
-                          f"Exception is {ex}")
-            telegram(f'Reference_import_tracking : Ошибка при получение информации из базы данных. Индекс строки {index}.Ошибка {ex}')
+            logger.error(f"Error getting data from database. Exception is {ex}")
+            client.close()
+            telegram(f'Reference_import_tracking : Ошибка при получение информации из базы данных. '
+                     f'Файл : {file_path}. Ошибка {ex}')
             print("9", file=sys.stderr)
             sys.exit(9)
 
+    @staticmethod
+    def get_exit_message(missing_rows):
+        """
+        7_in_row_2_5_9 or 7_in_row_2_5_..._and_10_more.
+        """
+        rows = "_".join(str(row) for row in missing_rows[:MAX_ROWS_IN_EXIT_MESSAGE])
+        more = len(missing_rows) - MAX_ROWS_IN_EXIT_MESSAGE
+        return f"7_in_row_{rows}_and_{more}_more" if more > 0 else f"7_in_row_{rows}"
+
     def process(self, file_path):
-        logging.info(f'file is {os.path.basename(file_path)} {datetime.datetime.now()}')
-        with open(file_path, newline='') as csvfile:
-            lines = list(csv.DictReader(csvfile))
-        logging.info(f'lines type is {type(lines)} and contain {len(lines)} items')
-        logging.info(f'First 3 items are: {lines[:3]}')
+        logger.info('file is %s %s', os.path.basename(file_path), datetime.datetime.now())
+        lines = list(read_dicts(file_path))
+        logger.info('lines type is %s and contain %s items', type(lines), len(lines))
+        logger.info('First 3 items are: %s', lines[:3])
         fileds_to_get = ['uuid', 'tracking_seaport', 'tracking_country']
         data = []
         try:
-            client = get_client(host=os.getenv('HOST'), database=os.getenv('DATABASE'), username=os.getenv('USERNAME_DB'),
-                                password=os.getenv('PASSWORD'))
+            client = get_clickhouse_client()
         except Exception as ex:
-            logging.error(f"Error connection to database. Exception is {ex}")
+            logger.error(f"Error connection to database. Exception is {ex}")
             print("8", file=sys.stderr)
             telegram(f'ошибка при подключение к базе данных.Файл : {file_path}')
             sys.exit(8)
+        regions = self.get_regions(client, file_path)
+        client.close()
+        missing_rows = []
         for index, line in enumerate(lines):
             new_line = {k: v.strip() for k, v in line.items() if k in fileds_to_get}
-            if self.get_field_from_db(new_line["tracking_seaport"], new_line["tracking_country"], client, index):
+            if (new_line["tracking_seaport"], new_line["tracking_country"]) in regions:
                 data.append(new_line)
             else:
-                client.close()
-                print(f"7_in_row_{index + 1}", file=sys.stderr)
-                telegram(f'Небыли получены данные из таблицы reference_region. Файл : {file_path}. Код ошибки 7')
-                sys.exit(7)
-        client.close()
+                logger.error("Row %s is not in reference_region. Data is %s", index + 1, new_line)
+                missing_rows.append(index + 1)
+        if missing_rows:
+            print(self.get_exit_message(missing_rows), file=sys.stderr)
+            rows = ", ".join(str(row) for row in missing_rows[:100])
+            telegram(f'Небыли получены данные из таблицы reference_region. Файл : {file_path}. Код ошибки 7. '
+                     f'Строки ({len(missing_rows)}): {rows}{" ..." if len(missing_rows) > 100 else ""}')
+            sys.exit(7)
         return data
 
 
-input_file_path = os.path.abspath(sys.argv[1])
-basename = os.path.basename(input_file_path)
-output_file_path = os.path.join(sys.argv[2], f'{basename}.json')
-print(f"output_file_path is {output_file_path}")
+def main(input_file_path, output_folder):
+    input_file_path = os.path.abspath(input_file_path)
+    basename = os.path.basename(input_file_path)
+    output_file_path = os.path.join(output_folder, f'{basename}.json')
+    print(f"output_file_path is {output_file_path}")
 
+    write_json(output_file_path, ReferenceImportTracking().process(input_file_path))
 
-parsed_data = ReferenceImportTracking().process(input_file_path)
 
-with open(output_file_path, 'w', encoding='utf-8') as f:
-    json.dump(parsed_data, f, ensure_ascii=False, indent=4)
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
@@ -1,23 +1,33 @@
-import re
 import os
 import sys
 import json
 import logging
+import app_logger
 import contextlib
 import numpy as np
 import pandas as pd
 from __init__ import *
-from fuzzywuzzy import fuzz
 from datetime import datetime
 from dotenv import load_dotenv
+from excel_reader import read_dataframe
+from name_similarity import score_names
+from json_writer import write_json, write_json_chunks
 from threading import current_thread
-from clickhouse_connect import get_client
-from deep_translator import GoogleTranslator
+from fts_snapshot import LOOKUP_THRESHOLD, FtsSnapshot, get_fts_client, lookup_inns
+from translator import Translator, get_cache
 from concurrent.futures import ThreadPoolExecutor
 
 
 load_dotenv()
 
+# rows - a json file for every row (as before), single - one json file for the whole file,
+# chunked - files of REFERENCE_INN_CHUNK_SIZE rows. In single and chunked modes every record has row_index.
+OUTPUT_MODES: tuple = ("rows", "single", "chunked")
+OUTPUT_MODE: str = os.environ.get("REFERENCE_INN_OUTPUT", "rows")
+CHUNK_SIZE: int = int(os.environ.get("REFERENCE_INN_CHUNK_SIZE", 5000))
+# Number of processes for confidence_rate (1 - in the current process).
+SCORING_PROCESSES: int = int(os.environ.get("REFERENCE_INN_SCORING_PROCESSES", 1))
+
 
 # def get_my_env_var(var_name: str) -> str:
 #     try:
@@ -42,40 +52,43 @@ class ReferenceInn:
         self.output_folder = output_folder
         self.worker_count = worker_count
         self.logger = self.setup_logging()
+        self.translations = {}
+        self.confidence_rates = {}
+
+    def get_logger_name(self):
+        return f"{os.path.basename(__file__).replace('.py', '')}_{os.path.basename(self.input_file_path)}"
 
     def setup_logging(self):
-        if not os.path.exists(f"{os.environ.get('XL_IDP_PATH_REFERENCE_SCRIPTS')}/logging"):
-            os.mkdir(f"{os.environ.get('XL_IDP_PATH_REFERENCE_SCRIPTS')}/logging")
-        _log_format: str = "[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s"
-        logging.basicConfig(filename=f"{os.environ.get('XL_IDP_PATH_REFERENCE_SCRIPTS')}/logging/"
-                                     f"{os.path.basename(__file__).replace('.py', '')}_"
-                                     f"{os.path.basename(self.input_file_path)}.log",
-                            level=logging.DEBUG, format=_log_format)
-        # console_out = logging.StreamHandler()
-        logger_stream = logging.getLogger("stream")
-        if logger_stream.hasHandlers():
-            logger_stream.handlers.clear()
-        # logger_stream.addHandler(console_out)
-        logger_stream = CustomAdapter(logger_stream, {"thread": None})
-        logger_stream.setLevel(logging.INFO)
-        return logger_stream
-
-    def connect_to_db(self):
-        """
-        Connecting to clickhouse.
-        :return: Client ClickHouse.
+        """
+        Log of the input file. The file of the log is closed at the end of main.
+        """
+        return CustomAdapter(app_logger.get_logger(self.get_logger_name()), {"thread": None})
+
+    def connect_to_db(self, parsed_data):
+        """
+        Connecting to clickhouse and getting INN -> name_of_the_contract_holder from fts.
+        If there are few INNs in the file, only they are queried from fts (REFERENCE_FTS_LOOKUP_THRESHOLD).
+        Otherwise, the local snapshot of fts is updated: only new rows of fts are downloaded.
+        REFERENCE_FTS_FULL_RELOAD=1 downloads the whole table.
+        :param parsed_data: Rows of the file.
+        :return: Dictionary or snapshot of fts.
         """
         try:
-            client = get_client(host=get_my_env_var('HOST'), database="fts",
-                                username=get_my_env_var('USERNAME_DB'), password=get_my_env_var('PASSWORD'))
+            client = get_fts_client()
             self.logger.info("Successfully connect to db")
-            fts = client.query("SELECT DISTINCT recipients_tin, senders_tin, name_of_the_contract_holder FROM fts")
-            # Чтобы проверить, есть ли данные. Так как переменная образуется, но внутри нее могут быть ошибки.
-            print(fts.result_rows[0])
-            fts_recipients_inn: dict = {row[0]: row[2] for row in fts.result_rows}
-            fts_senders_inn: dict = {row[1]: row[2] for row in fts.result_rows}
-            fts_inn: dict = {**fts_recipients_inn, **fts_senders_inn}
-            return fts_inn
+            inns = {dict_data.get('company_inn') for dict_data in parsed_data if dict_data.get('company_inn')}
+            if len(inns) <= LOOKUP_THRESHOLD:
+                self.logger.info(f"Lookup of {len(inns)} INNs in fts")
+                fts_inn = lookup_inns(client, inns)
+                client.close()
+                return fts_inn
+            fts_inn = FtsSnapshot()
+            fts_inn.refresh(client, full_reload=os.environ.get("REFERENCE_FTS_FULL_RELOAD", "0") == "1")
+            client.close()
+            # Чтобы проверить, есть ли данные. Так как снапшот создается, но внутри него может не быть данных.
+            if not len(fts_inn):
+                raise ValueError("Snapshot of fts is empty")
+            return fts_inn.open()
         except Exception as ex_connect:
             self.logger.error(f"Error connection to db {ex_connect}. Type error is {type(ex_connect)}.")
             print("error_connect_db", file=sys.stderr)
@@ -94,7 +107,7 @@ class ReferenceInn:
             "Проверен ИНН": "is_checked_inn"
         }
 
-        df = pd.read_csv(self.input_file_path, dtype=str)
+        df = read_dataframe(self.input_file_path, dtype=str)
         df['company_name_rus'] = None
         df['is_inn_found_auto'] = False
         df['confidence_rate'] = None
@@ -105,7 +118,8 @@ class ReferenceInn:
         return df.to_dict('records')
 
     def write_to_json(self, i, dict_data):
-        self.logger.info(f'{i} data is {dict_data["company_name"]}', thread=current_thread().ident)
+        self.logger.info('%s data is %s', i, dict_data["company_name"], thread=current_thread().ident,
+                         extra=app_logger.SAMPLE_ROWS)
         basename = os.path.basename(self.input_file_path)
         output_file_path = os.path.join(self.output_folder, f'{basename}_{i}.json')
         with open(output_file_path, 'w', encoding='utf-8') as f:
@@ -133,29 +147,94 @@ class ReferenceInn:
             if company_inn:
                 self.join_fts(fts, dict_data, company_inn, 0)
             if company_name_rus:
-                dict_data['company_name_rus'] = GoogleTranslator(source='en', target='ru').translate(company_name_rus)
+                # KeyError if the name is not translated: the rest of the row is skipped, as with a failed request.
+                dict_data['company_name_rus'] = self.translations[company_name_rus]
             if company_name_unified:
-                company_name_unified = re.sub(" +", " ", company_name_unified)
-                company_name_rus = re.sub(" +", " ", company_name_rus)
-                company_name_unified = \
-                        company_name_unified.translate({ord(c): " " for c in r",'!@#$%^&*()[]{};<>?\|`~=_+"})
-                company_name_rus = \
-                        company_name_rus.translate({ord(c): "" for c in r",'!@#$%^&*()[]{};<>?\|`~=_+"})
-                dict_data['confidence_rate'] = fuzz.partial_ratio(company_name_unified.upper(),
-                                                                  company_name_rus.upper())
+                # KeyError if there is no company name: the rest of the row is skipped, as before.
+                dict_data['confidence_rate'] = self.confidence_rates[i]
             if "is_checked_inn" in dict_data:
                 dict_data['is_checked_inn'] = is_checked_inn is not None \
                                               and is_checked_inn.upper() in ['ДА', 'ИСТИНА', 'TRUE']
         dict_data['original_file_name'] = os.path.basename(self.input_file_path)
         dict_data['original_file_parsed_on'] = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-        self.write_to_json(i, dict_data)
+        if OUTPUT_MODE == "rows":
+            self.write_to_json(i, dict_data)
+        return dict_data
+
+    def process_row(self, args):
+        """
+        Parse the row in the worker thread. The row with an error is not written, as before.
+        :return: Row or None.
+        """
+        i, dict_data, fts = args
+        try:
+            return self.parse_data(i, dict_data, fts)
+        except Exception as ex:
+            self.logger.error(f'{i} row is not parsed. Error is {ex}. Type error is {type(ex)}',
+                              thread=current_thread().ident)
+            return None
+
+    def iter_parsed_rows(self, executor, parsed_data, fts):
+        """
+        Results of the workers in the order of the rows, with the index of the row.
+        """
+        rows = ((i, dict_data, fts) for i, dict_data in enumerate(parsed_data, 2))
+        for i, dict_data in enumerate(executor.map(self.process_row, rows), 2):
+            if dict_data is not None:
+                self.logger.info('%s data is %s', i, dict_data["company_name"], extra=app_logger.SAMPLE_ROWS)
+                yield {"row_index": i, **dict_data}
+
+    def write_consolidated(self, executor, parsed_data, fts):
+        """
+        Write all rows with a single writer into one file or into chunks of CHUNK_SIZE rows.
+        """
+        basename = os.path.basename(self.input_file_path)
+        rows = self.iter_parsed_rows(executor, parsed_data, fts)
+        if OUTPUT_MODE == "chunked":
+            write_json_chunks(os.path.join(self.output_folder, basename), rows, CHUNK_SIZE)
+        else:
+            write_json(os.path.join(self.output_folder, f'{basename}.json'), rows)
+
+    @staticmethod
+    def translate_company_names(parsed_data):
+        """
+        Translate all company names of the file in batches, using the cache of translations.
+        :return: Name -> translation.
+        """
+        with get_cache() as cache:
+            return Translator(cache=cache).translate_many(dict_data.get('company_name') for dict_data in parsed_data)
+
+    @staticmethod
+    def get_confidence_rates(parsed_data):
+        """
+        Score the similarity of company_name_unified and company_name for all rows at once.
+        :return: Index of the row -> confidence_rate.
+        """
+        scores = score_names([dict_data.get('company_name_unified') for dict_data in parsed_data],
+                             [dict_data.get('company_name') for dict_data in parsed_data], SCORING_PROCESSES)
+        return {i: score for i, score in enumerate(scores, 2) if score is not None}
 
     def main(self):
-        fts = self.connect_to_db()
+        try:
+            self.parse()
+        finally:
+            app_logger.release_logger(self.get_logger_name())
+
+    def parse(self):
+        if OUTPUT_MODE not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode {OUTPUT_MODE}. Expected one of {OUTPUT_MODES}")
         parsed_data = self.load_data()
+        fts = self.connect_to_db(parsed_data)
+        self.translations = self.translate_company_names(parsed_data)
+        self.confidence_rates = self.get_confidence_rates(parsed_data)
         with ThreadPoolExecutor(max_workers=self.worker_count) as executor:
-            for i, dict_data in enumerate(parsed_data, 2):
-                executor.submit(self.parse_data, i, dict_data, fts)
+            if OUTPUT_MODE == "rows":
+                for i, dict_data in enumerate(parsed_data, 2):
+                    executor.submit(self.parse_data, i, dict_data, fts)
+            else:
+                self.write_consolidated(executor, parsed_data, fts)
+        if isinstance(fts, FtsSnapshot):
+            fts.close()
 
 
 if __name__ == "__main__":
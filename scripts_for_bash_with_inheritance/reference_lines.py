@@ -1,43 +1,33 @@
-import csv
 import os
 import sys
-import logging
-import json
 import datetime
+import app_logger
+from excel_reader import read_rows
+from clickhouse_sink import write_output
 
-if not os.path.exists("logging"):
-    os.mkdir("logging")
-
-logging.basicConfig(filename="logging/{}.log".format(os.path.basename(__file__)), level=logging.DEBUG)
-log = logging.getLogger()
+logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.datetime.now().date()))
 
 
 def process(input_file_path):
-    logging.info(u'file is {} {}'.format(os.path.basename(input_file_path), datetime.datetime.now()))
-    parsed_data = list()
-    with open(input_file_path, newline='') as csvfile:
-        lines = list(csv.reader(csvfile))
-    for ir, line in enumerate(lines):
+    logger.info(u'file is %s %s', os.path.basename(input_file_path), datetime.datetime.now())
+    for ir, line in enumerate(read_rows(input_file_path)):
         if ir > 0:
             parsed_record = dict()
             parsed_record['line'] = line[0].strip()
             parsed_record['line_unified'] = line[1].strip()
-            parsed_data.append(parsed_record)
+            logger.info(u"record is %s", parsed_record, extra=app_logger.SAMPLE_ROWS)
+            yield parsed_record
 
-    logging.error(u"About to write parsed_data to output: {}".format(parsed_data))
-    return parsed_data
 
+def main(input_file_path, output_folder):
+    input_file_path = os.path.abspath(input_file_path)
+    basename = os.path.basename(input_file_path)
+    output_file_path = os.path.join(output_folder, basename+'.json')
+    print("output_file_path is {}".format(output_file_path))
 
-# input_file_path = "/home/timur/PycharmWork/containers/17.02/csv/Справочник по линиямxlsx.xlsx.csv"
-# output_folder = "/home/timur/PycharmWork/containers/17.02/json/"
-input_file_path = os.path.abspath(sys.argv[1])
-output_folder = sys.argv[2]
-basename = os.path.basename(input_file_path)
-output_file_path = os.path.join(output_folder, basename+'.json')
-print("output_file_path is {}".format(output_file_path))
+    count = write_output(output_file_path, process(input_file_path), "reference_lines")
+    print("{} records are written".format(count))
 
-parsed_data = process(input_file_path)
-print(parsed_data)
 
-with open(output_file_path, 'w', encoding='utf-8') as f:
-    json.dump(parsed_data, f, ensure_ascii=False, indent=4)
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
@@ -1,17 +1,13 @@
-import csv
 import os
-import logging
 import sys
-import json
 from itertools import tee
 import datetime
+import app_logger
 from __init__ import LIST_MONTHS
+from excel_reader import read_rows
+from clickhouse_sink import write_output
 
-if not os.path.exists("logging"):
-    os.mkdir("logging")
-
-logging.basicConfig(filename="logging/{}.log".format(os.path.basename(__file__)), level=logging.DEBUG)
-log = logging.getLogger()
+logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.datetime.now().date()))
 
 
 def merge_two_dicts(x, y):
@@ -28,17 +24,15 @@ def pairwise(iterable):
 
 
 def process(input_file_path):
-    logging.info(u'file is {} {}'.format(os.path.basename(input_file_path), datetime.datetime.now()))
+    logger.info(u'file is %s %s', os.path.basename(input_file_path), datetime.datetime.now())
     context = dict()
-    parsed_data = list()
-    with open(input_file_path, newline='') as csvfile:
-        lines = list(csv.reader(csvfile))
+    lines = list(read_rows(input_file_path))
 
-    logging.info(u'lines type is {} and contain {} items'.format(type(lines), len(lines)))
-    logging.info(u'First 3 items are: {}'.format(lines[:3]))
+    logger.info(u'lines type is %s and contain %s items', type(lines), len(lines))
+    logger.info(u'First 3 items are: %s', lines[:3])
 
     for ir, line in enumerate(lines):
-        logging.info(u'line {} is {}'.format(ir, line))
+        logger.info(u'line %s is %s', ir, line, extra=app_logger.SAMPLE_ROWS)
         if ir == 0:
             text = line[0].split()
             for month in text:
@@ -49,7 +43,7 @@ def process(input_file_path):
                     # year = text.index(month) + 1
             context["month"] = month_digit
             context["year"] = year
-            logging.info(u"context now is {}".format(context))
+            logger.info(u"context now is %s", context)
             continue
         if ir > 0 and line[0] == 'АО "НЛЭ"':
             for value, next_value in pairwise(lines[ir+2:ir+6]):
@@ -69,24 +63,19 @@ def process(input_file_path):
                     float(value[6])
                 record_export = merge_two_dicts(context, parsed_record_export)
 
-                logging.info(u"record is {} {}".format(record, record_export))
-                parsed_data.append(record)
-                parsed_data.append(record_export)
-
-    logging.error(u"About to write parsed_data to output: {}".format(parsed_data))
-    return parsed_data
+                logger.info(u"record is %s %s", record, record_export, extra=app_logger.SAMPLE_ROWS)
+                yield record
+                yield record_export
 
 
-# input_file_path = "/home/timur/PycharmWork/containers/morservice/csv/Морсервис_Контейнеры тн и ДФЭ 12.21.xls.csv"
-# output_folder = "/home/timur/PycharmWork/containers/morservice/json/"
-input_file_path = os.path.abspath(sys.argv[1])
-output_folder = sys.argv[2]
-basename = os.path.basename(input_file_path)
-output_file_path = os.path.join(output_folder, basename+'.json')
-print("output_file_path is {}".format(output_file_path))
+def main(input_file_path, output_folder):
+    input_file_path = os.path.abspath(input_file_path)
+    basename = os.path.basename(input_file_path)
+    output_file_path = os.path.join(output_folder, basename+'.json')
+    print("output_file_path is {}".format(output_file_path))
 
+    write_output(output_file_path, process(input_file_path), "reference_morservice")
 
-parsed_data = process(input_file_path)
 
-with open(output_file_path, 'w', encoding='utf-8') as f:
-    json.dump(parsed_data, f, ensure_ascii=False, indent=4)
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2])
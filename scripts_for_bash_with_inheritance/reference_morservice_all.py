@@ -1,28 +1,33 @@
 import os
 import sys
-import csv
-import json
 import math
 from itertools import tee
 from datetime import datetime
+from collections import deque
+from __init__ import LIST_MONTHS
+from excel_reader import read_rows
+from clickhouse_sink import write_output
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from numpy.lib.user_array import container
+# Направление -> название столбца в шапке таблицы.
+DIRECTIONS: Tuple[Tuple[str, str], ...] = (
+    ("export", "Экспорт"),
+    ("import", "Импорт"),
+    ("transit", "Транзит"),
+    ("cabotage", "Каботаж")
+)
 
-from __init__ import LIST_MONTHS
-from typing import Dict, Union, Tuple
+# Строка с "тыс.тонн" и следующие за ней 5 строк с данными по направлениям.
+WINDOW_SIZE: int = 6
 
 
 class ReferenceMorService(object):
-    dict_columns_position: Dict[str, Tuple[str, Union[None, int]]] = {
-        "export": ("Экспорт", None),
-        "import": ("Импорт", None),
-        "transit": ("Транзит", None),
-        "cabotage": ("Каботаж", None)
-    }
-
     def __init__(self, input_file_path: str, output_folder: str):
         self.input_file_path: str = input_file_path
         self.output_folder: str = output_folder
+        # Состояние разбора файла: дата из заголовка, бассейн и порт, индексы столбцов направлений текущей таблицы.
+        self.context: dict = {}
+        self.columns_position: Dict[str, Optional[int]] = {direction: None for direction, _ in DIRECTIONS}
 
     @staticmethod
     def merge_two_dicts(x: Dict, y: Dict) -> Dict:
@@ -64,23 +69,21 @@ class ReferenceMorService(object):
                 context["year"] = int(date)
         context["datetime"] = f"{context['year']}-{context['month'] :02}-01"
 
-    def _get_direction_indexes(self, lines: list, context: dict) -> None:
+    def _get_direction_indexes(self, lines: list) -> None:
         """
-        Получаем индексы направлений (export, import, transit, cabotage) в таблице.
-        :param lines: Сырые данные.
-        :param context: Словарь для соединения последующих вычислений.
+        Получаем индексы направлений (export, import, transit, cabotage) в таблице один раз для шапки таблицы.
+        :param lines: Строка шапки с направлениями и следующая строка с годами.
         :return:
         """
-        for current_line, next_line in self.pairwise(lines):
-            for column in self.dict_columns_position:
-                index_direction: int = current_line.index(self.dict_columns_position[column][0])
-                list_indices: list = [idx for idx, value in enumerate(next_line) if
-                                      value == str(float(context["year"]))]
-                self.dict_columns_position[column] = (
-                    self.dict_columns_position[column][0],
-                    min(list_indices, key=lambda x: abs(index_direction - abs(x)))  # находим ближайшее число из списка
-                    # к переменной index_direction
-                )
+        if len(lines) < 2:
+            return
+        current_line, next_line = lines[0], lines[1]
+        year: str = str(float(self.context["year"]))
+        list_indices: List[int] = [idx for idx, value in enumerate(next_line) if value == year]
+        for direction, column_name in DIRECTIONS:
+            index_direction: int = current_line.index(column_name)
+            # Находим ближайший к index_direction столбец текущего года.
+            self.columns_position[direction] = min(list_indices, key=lambda x: abs(index_direction - abs(x)))
 
     @staticmethod
     def parse_float(value: str) -> Union[float, None]:
@@ -95,111 +98,121 @@ class ReferenceMorService(object):
             result = None
         return result
 
-    def _get_data_from_direction(self, terminal_operator: str, lines: list, context: dict, parsed_data: list) -> None:
+    def _get_data_from_direction(self, terminal_operator: str, lines: list) -> Iterator[dict]:
         """
         Получаем данные из направлений и вычисляем teu.
         :param terminal_operator: Оператор терминала.
-        :param lines: Сырые данные.
-        :param context: Словарь для соединения последующих вычислений.
-        :param parsed_data: Отпарсенные данные.
-        :return:
+        :param lines: Строка с "тыс.тонн" и следующие за ней строки.
+        :return: Отпарсенные записи.
         """
         tonnage = lines[:1][0]
         for current_line, next_line in self.pairwise(lines[2:]):
-            for column, indexes in self.dict_columns_position.items():
+            for direction, index in self.columns_position.items():
                 parsed_record: dict = {
-                    "direction": column,
+                    "direction": direction,
                     "terminal_operator": terminal_operator,
                     "is_empty": current_line[1] == 'порожние',
                     "container_type": 'REF' if current_line[1].strip() == 'из них реф.' else None,
-                    "teu": self.parse_float(current_line[indexes[1]]) - self.parse_float(next_line[indexes[1]])
-                    if current_line[1] == 'груженые' and current_line[indexes[1]] and next_line[indexes[1]]
-                    else self.parse_float(current_line[indexes[1]]),
+                    "teu": self.parse_float(current_line[index]) - self.parse_float(next_line[index])
+                    if current_line[1] == 'груженые' and current_line[index] and next_line[index]
+                    else self.parse_float(current_line[index]),
                     "original_file_name": os.path.basename(self.input_file_path),
                     "original_file_parsed_on": str(datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                    'tonnage': self.get_tonnage(tonnage, indexes) if current_line[1] == 'груженые' else None
+                    'tonnage': self.get_tonnage(tonnage, index) if current_line[1] == 'груженые' else None
                 }
-                parsed_data.append(self.merge_two_dicts(context, parsed_record))
+                yield self.merge_two_dicts(self.context, parsed_record)
 
     @staticmethod
-    def get_tonnage(current_line: list, indexes: tuple) -> float:
+    def get_tonnage(current_line: list, index: int) -> float:
         """Получение информации о тыс.тонн из строки.
         :param current_line: Список строк.
-        :param indexes: Индексы.
+        :param index: Индекс столбца направления.
         :return: Тыс.тонн. или None."""
-        tonnage = current_line[indexes[1] - 1:indexes[1] + 2]
+        tonnage = current_line[index - 1:index + 2]
         tonnage = tonnage[1]
         return float(tonnage) if tonnage else None
 
-    def parse_data(self, lines: list) -> list:
+    @staticmethod
+    def iter_windows(lines: Iterable[list], size: int) -> Iterator[list]:
+        """
+        Строка вместе со следующими за ней строками, как lines[i:i + size], без хранения всего списка строк.
+        :param lines: Строки.
+        :param size: Размер окна.
+        :return: Окна строк.
+        """
+        window: deque = deque(maxlen=size)
+        for line in lines:
+            window.append(line)
+            if len(window) == size:
+                yield list(window)
+        if len(window) == size:
+            window.popleft()
+        while window:
+            yield list(window)
+            window.popleft()
+
+    def parse_data(self, lines: Iterable[list]) -> Iterator[dict]:
         """
         Парсим данные из шапки (берем год, месяц, квартал), самой таблицы (т.е. вычисляем teu, берем направление, порт,
-        бассейн из столбцов и т.д.).
+        бассейн из столбцов и т.д.). Строки читаются один раз, записи возвращаются по мере разбора.
         :param lines: Сырые данные.
         :return: Отпарсенные данные.
         """
-        context: dict = {}
-        parsed_data: list = []
-        for i, line in enumerate(lines):
+        for window in self.iter_windows(lines, WINDOW_SIZE):
+            line: list = window[0]
+            filled_cells: int = sum(1 for data in line if data)
             for data in line:
+                data_lower: str = data.lower()
                 if "Объём перевалки грузов" in data:
-                    self._get_date_from_header(data, context)
+                    self._get_date_from_header(data, self.context)
                 elif "Бассейн" in data and "Порт" in data:
-                    self._get_direction_indexes(lines[i:i + 2], context)
-                elif "бассейн" in data.lower() and len(list(filter(None, line))) == 1:
-                    context["bay"] = data
-                elif "порт" in data.lower() and "итого" not in data.lower() and len(list(filter(None, line))) == 1:
-                    context["port"] = data
+                    self._get_direction_indexes(window[:2])
+                elif "бассейн" in data_lower and filled_cells == 1:
+                    self.context["bay"] = data
+                elif "порт" in data_lower and "итого" not in data_lower and filled_cells == 1:
+                    self.context["port"] = data
                 elif "тыс.тонн" in data:
-                    self._get_data_from_direction(line[0], lines[i:i + 6], context, parsed_data)
-        return parsed_data
+                    yield from self._get_data_from_direction(line[0], window)
 
     @staticmethod
-    def remove_extra_lines(parsed_data: list) -> list:
-        return [line for line in parsed_data if "Итого" not in line["terminal_operator"]]
+    def remove_extra_lines(parsed_data: Iterable[dict]) -> Iterator[dict]:
+        return (line for line in parsed_data if "Итого" not in line["terminal_operator"])
 
-    def write_to_json(self, parsed_data: list) -> None:
+    def write_to_json(self, parsed_data: Iterator[dict]) -> None:
         """
-        Записываем отпарсенные данные в json.
+        Записываем отпарсенные данные в json и/или ClickHouse (REFERENCE_OUTPUT).
         :param parsed_data: Отпарсенные данные.
         :return:
         """
         output_file_path: str = os.path.join(self.output_folder, f'{os.path.basename(self.input_file_path)}.json')
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=4)
-
-    def read_csv(self) -> list:
-        """
-        Читаем csv-файл.
-        :return: Данные csv-файла в виде списка.
-        """
-        with open(self.input_file_path, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            data = list(reader)
-
-            if not data:
-                return data  # Return if data is empty
-            columns = list(zip(*data))
-
-            # Filter out columns that are empty excluding the header
-            filtered_columns = [
-                col for col in columns if any(cell.strip() for cell in col[1:])
-            ]
-
-            # Transpose the data back to the original format
-            filtered_data = list(zip(*filtered_columns))
-
-            return [list(row) for row in filtered_data]
+        write_output(output_file_path, parsed_data, "reference_morservice_all")
+
+    def read_csv(self) -> Iterator[list]:
+        """
+        Читаем файл (xls, xlsx или csv) и убираем столбцы, пустые во всех строках, кроме первой.
+        Файл читается два раза: сначала ищем заполненные столбцы, затем возвращаем строки только с ними,
+        поэтому в памяти не держится весь файл.
+        :return: Строки файла.
+        """
+        # Строки обрезаются по самой короткой, как при zip(*data).
+        width: Optional[int] = None
+        filled_columns: set = set()
+        for row_index, row in enumerate(read_rows(self.input_file_path)):
+            width = len(row) if width is None else min(width, len(row))
+            if row_index > 0:
+                filled_columns.update(index for index, cell in enumerate(row) if cell.strip())
+        columns: List[int] = sorted(index for index in filled_columns if index < (width or 0))
+        if not columns:
+            return
+        for row in read_rows(self.input_file_path):
+            yield [row[index] for index in columns]
 
     def main(self) -> None:
         """
         Основная функция, которая запускает код.
         :return:
         """
-        lines: list = self.read_csv()
-        parsed_data: list = self.parse_data(lines)
-        parsed_data = self.remove_extra_lines(parsed_data)
-        self.write_to_json(parsed_data)
+        self.write_to_json(self.remove_extra_lines(self.parse_data(self.read_csv())))
 
 
 if __name__ == "__main__":
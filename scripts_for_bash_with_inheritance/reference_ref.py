@@ -1,9 +1,9 @@
 import os
 import sys
-import json
 import numpy as np
 import pandas as pd
 from pandas import DataFrame
+from json_writer import write_json
 
 headers_eng: dict = {
     "Наименование": "goods_name",
@@ -23,8 +23,7 @@ class ReferenceRef(object):
         """
         basename: str = os.path.basename(self.input_file_path)
         output_file_path: str = os.path.join(self.output_folder, f'{basename}.json')
-        with open(f"{output_file_path}", 'w', encoding='utf-8') as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=4)
+        write_json(output_file_path, parsed_data)
 
     def main(self) -> None:
         """
@@ -0,0 +1,78 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Deque, Dict, List, Set, Tuple
+
+
+class ReferenceScheduler(object):
+    def __init__(self, worker: Callable, max_workers: int, limits: Dict[str, int]):
+        """
+        Run files of different reference types in parallel in a bounded process pool.
+        :param worker: Function (name, file) -> result, executed in the pool. Must be picklable.
+        :param max_workers: Size of the process pool.
+        :param limits: Maximum number of files of one reference type processed at the same time.
+        """
+        self.worker: Callable = worker
+        self.max_workers: int = max_workers
+        self.limits: Dict[str, int] = limits
+        self.executor: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=max_workers)
+        self.queues: Dict[str, Deque[str]] = {name: deque() for name in limits}
+        self.running: Dict[str, int] = {name: 0 for name in limits}
+        self.futures: Dict[Future, Tuple[str, str, int]] = {}
+        self.files: Set[str] = set()
+        self.generation: int = 0
+
+    def submit(self, name: str, file: str) -> bool:
+        """
+        Put the file into the queue of its reference type. A file that is already queued or running is skipped.
+        """
+        if file in self.files:
+            return False
+        self.files.add(file)
+        self.queues[name].append(file)
+        return True
+
+    def dispatch(self) -> None:
+        """
+        Start queued files while there are free workers and the limit of the reference type is not reached.
+        """
+        for name, queue in self.queues.items():
+            while queue and self.running[name] < self.limits[name] and len(self.futures) < self.max_workers:
+                file: str = queue.popleft()
+                self.futures[self.executor.submit(self.worker, name, file)] = name, file, self.generation
+                self.running[name] += 1
+
+    def collect(self) -> List[Tuple[str, str, object]]:
+        """
+        Get finished files. If the worker failed, its exception is returned instead of the result.
+        """
+        finished: List[Tuple[str, str, object]] = []
+        for future in [future for future in self.futures if future.done()]:
+            name, file, generation = self.futures.pop(future)
+            self.running[name] -= 1
+            self.files.discard(file)
+            exception = future.exception()
+            if isinstance(exception, BrokenProcessPool) and generation == self.generation:
+                self.restart()
+            finished.append((name, file, exception or future.result()))
+        return finished
+
+    def restart(self) -> None:
+        """
+        Recreate the pool after a worker process died (the other running files are reported as failed too).
+        """
+        self.executor.shutdown(wait=False)
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self.generation += 1
+
+    def get_queue_depth(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Number of queued and running files for each reference type which has any.
+        """
+        return {
+            name: (len(queue), self.running[name])
+            for name, queue in self.queues.items() if queue or self.running[name]
+        }
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
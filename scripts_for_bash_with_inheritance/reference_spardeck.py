@@ -1,12 +1,12 @@
 import os
 import sys
-import json
 import contextlib
 import numpy as np
 import pandas as pd
-from typing import Union
-from pandas import DataFrame
+from pandas import DataFrame, Series
 from datetime import datetime
+from json_writer import write_json
+from date_parser import parse_dates
 
 HEADERS_ENG: dict = {
     "Vessel": "vessel",
@@ -35,21 +35,24 @@ class ReferenceSparDeck(object):
         self.output_folder: str = output_folder
 
     @staticmethod
-    def parse(date: Union[str, None]):
-        if isinstance(date, str):
-            for fmt in DATE_FORMATS:
-                with contextlib.suppress(ValueError):
-                    return datetime.strptime(date, fmt).strftime("%Y-%m-%d")
-        print("Неуказанные форматы", date)
+    def parse(dates: Series) -> list:
+        """
+        Parse the column of dates with the first format of DATE_FORMATS which fits.
+        """
+        parsed_dates: list = parse_dates(dates.tolist(), DATE_FORMATS, lambda date: date.strftime("%Y-%m-%d"))
+        for date, parsed_date in zip(dates, parsed_dates):
+            if parsed_date is None:
+                print("Неуказанные форматы", date)
+        return parsed_dates
 
     def change_type_and_values(self, df: DataFrame) -> None:
         """
         Change data types or changing values.
         """
         with contextlib.suppress(Exception):
-            df['ata_enter_zone'] = df['ata_enter_zone'].apply(lambda x: self.parse(x))
-            df['atb_moor_pier'] = df['atb_moor_pier'].apply(lambda x: self.parse(x))
-            df['atd_move_pier'] = df['atd_move_pier'].apply(lambda x: self.parse(x))
+            df['ata_enter_zone'] = self.parse(df['ata_enter_zone'])
+            df['atb_moor_pier'] = self.parse(df['atb_moor_pier'])
+            df['atd_move_pier'] = self.parse(df['atd_move_pier'])
 
     def add_new_columns(self, df: DataFrame) -> None:
         """
@@ -64,8 +67,7 @@ class ReferenceSparDeck(object):
         """
         basename: str = os.path.basename(self.input_file_path)
         output_file_path: str = os.path.join(self.output_folder, f'{basename}.json')
-        with open(f"{output_file_path}", 'w', encoding='utf-8') as f:
-            json.dump(parsed_data, f, ensure_ascii=False, indent=4)
+        write_json(output_file_path, parsed_data)
 
     def main(self) -> None:
         """
@@ -81,5 +83,6 @@ class ReferenceSparDeck(object):
         self.write_to_json(df.to_dict('records'))
 
 
-reference_spardeck: ReferenceSparDeck = ReferenceSparDeck(sys.argv[1], sys.argv[2])
-reference_spardeck.main()
\ No newline at end of file
+if __name__ == "__main__":
+    reference_spardeck: ReferenceSparDeck = ReferenceSparDeck(sys.argv[1], sys.argv[2])
+    reference_spardeck.main()
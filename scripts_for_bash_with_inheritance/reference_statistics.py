@@ -1,45 +1,26 @@
 import contextlib
-import csv
 import datetime
-import json
 import os
 import re
 import sys
-import logging
+import app_logger
 from collections import defaultdict
+from excel_reader import read_dicts
+from json_writer import write_json
+from typing import DefaultDict, Iterator, List, Tuple
 
-if not os.path.exists("logging"):
-    os.mkdir("logging")
-
-logging.basicConfig(filename="logging/{}.log".format(os.path.basename(__file__)), level=logging.DEBUG)
-log = logging.getLogger()
+logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.datetime.now().date()))
 
 month_list = ["ЯНВАРЬ", "ФЕВРАЛЬ", "МАРТ", "АПРЕЛЬ", "МАЙ", "ИЮНЬ", "ИЮЛЬ", "АВГУСТ", "СЕНТЯБРЬ", "ОКТЯБРЬ", "НОЯБРЬ",
               "ДЕКАБРЬ"]
 
-columns = defaultdict(list)  # each value in each column is appended to a list
-
-with open(os.path.abspath(sys.argv[1])) as f:
-    reader = csv.DictReader(f)  # read rows into a dictionary format
-    for row in reader:  # read a row as {column1: value1, column2: value2,...}
-        for (k, v) in row.items():  # go over each column name and value
-            columns[k].append(v)  # append the value into the appropriate list
-
+BLOCK_START: str = "ЛИНИЯ/АГЕНТ"
+BLOCK_END: str = " ИТОГО ШТ."
 
-def get_indices(x: list, value: int) -> list:
-    indices = list()
-    i = 0
-    while True:
-        try:
-            # find an occurrence of value and update i to that index
-            i = x.index(value, i)
-            # add i to the list
-            indices.append(i)
-            # advance i by 1
-            i += 1
-        except ValueError as e:
-            break
-    return indices
+DATE_PATTERN: re.Pattern = re.compile(r'(?<=\().*?(?=\))')
+SHIP_NUMBER_SPLIT_PATTERN: re.Pattern = re.compile(r'(\d+)[.]')
+SHIP_NUMBER_PATTERN: re.Pattern = re.compile(r"\d{1,3}[.].[A-Z]+")
+DIGIT_PATTERN: re.Pattern = re.compile(r'\d')
 
 
 def merge_two_dicts(x, y):
@@ -48,77 +29,99 @@ def merge_two_dicts(x, y):
     return z
 
 
-def parse_column(parsed_data, enum, column0, column1, enum_for_value):
-    with contextlib.suppress(Exception):
-        date_full = re.findall('(?<=\().*?(?=\))', columns[column1][enum])
-        ship_name = columns[column1][enum].replace(f"({date_full[0]})", "").strip()
-        ship_name = re.split(r'(\d+)[.]', ship_name)[-1]
-        context['ship_name'] = ship_name.strip() or columns[column1][enum]
-        date = date_full[0].split("-")
-        context['date_arrive'] = date[0].strip()
-        context['date_leave'] = date[1].strip()
-    context['direction'] = ("import" if columns[column1][enum + 1] == 'выгрузка' else "export") if columns[column1][enum + 1] else context['direction']
-    context['is_empty'] = columns[column1][enum + 2] != 'груженые' if columns[column1][enum + 2] else context['is_empty']
-    type = {'container_size': int("".join(re.findall("\d", columns[column1][enum + 3]))[:2])}
-    count = {'count': int(float(columns[column1][enum + enum_for_value]))}
-    line = {'line': columns[column0][enum + enum_for_value].rsplit('/', 1)[0].strip()}
-    x = {**line, **type, **count}
-    record = merge_two_dicts(context, x)
-    logging.info(f'data is {record}')
-    parsed_data.append(record)
-
-
-parsed_data = []
-context = dict()
-
-
-def process(input_file_path):
-    logging.info(u'file is {} {}'.format(os.path.basename(input_file_path), datetime.datetime.now()))
-    columns = defaultdict(list)  # each value in each column is appended to a list
-    with open(input_file_path) as file:
-        reader = csv.DictReader(file)  # read rows into a dictionary format
-        for row in reader:  # read a row as {column1:Линия/Агент value1, column2: value2,...}
+class ReferenceStatistics(object):
+    def __init__(self, input_file_path: str, output_folder: str):
+        """
+        Parser of one file. All state of the file is kept in the instance, so files can be parsed one after another
+        or in parallel in the same process.
+        """
+        self.input_file_path: str = os.path.abspath(input_file_path)
+        self.output_folder: str = output_folder
+        self.columns: DefaultDict[str, list] = defaultdict(list)
+        self.context: dict = {}
+
+    def read_columns(self) -> None:
+        """
+        Read the file once into columns: {column name: [value1, value2, ...]}.
+        """
+        for row in read_dicts(self.input_file_path):  # read a row as {column1:Линия/Агент value1, column2: value2,...}
             for (key, value) in row.items():  # go over each column name and value
-                columns[key].append(value)
-    zip_list = list(columns)
-    month = zip_list[0].rsplit(' ', 1)
-    if month[0].upper().strip() in month_list:
-        month_digit = month_list.index(month[0].strip()) + 1
-    context['month'] = month_digit
-    context['year'] = int(month[1])
-
-    counter = 0
-    list_values_upper = [x.upper() for x in columns[zip_list[0]]]
-    indices_line = get_indices(list_values_upper, "ЛИНИЯ/АГЕНТ")
-    indices_summ = get_indices(list_values_upper, " ИТОГО ШТ.")
-    for (enum, ship_name), ship_name_number in zip(enumerate(columns[zip_list[0]]), columns[zip_list[1]]):
-        number_ship = re.findall(r"\d{1,3}[.].[A-Z]+", ship_name_number)
-        try:
-            if ship_name.upper() == 'НАЗВАНИЕ СУДНА' or number_ship:
-                for column in zip_list:
-                    start = indices_line[counter]
-                    end = indices_summ[counter]
-                    list_index = [
-                        i + len(columns[zip_list[0]][enum:start+1])
-                        for i, item in enumerate(columns[column][start + 1:end])
-                        if re.search(r'\d', item)
-                    ]
-                    for enum_for_value in list_index:
-                        parse_column(parsed_data, enum, zip_list[0], column, enum_for_value)
-                counter += 1
-        except IndexError:
-            continue
-
-    return parsed_data
-
-
-input_file_path = os.path.abspath(sys.argv[1])
-output_folder = sys.argv[2]
-basename = os.path.basename(input_file_path)
-output_file_path = os.path.join(output_folder, basename + '.json')
-print("output_file_path is {}".format(output_file_path))
-
-parsed_data = process(input_file_path)
-
-with open(output_file_path, 'w', encoding='utf-8') as file:
-    json.dump(parsed_data, file, ensure_ascii=False, indent=4)
+                self.columns[key].append(value)
+
+    @staticmethod
+    def get_blocks(first_column: list) -> List[Tuple[int, int]]:
+        """
+        Rows of "ЛИНИЯ/АГЕНТ" and " ИТОГО ШТ." of every block of lines, found in one scan.
+        """
+        starts: List[int] = []
+        ends: List[int] = []
+        for index, value in enumerate(first_column):
+            value_upper: str = value.upper()
+            if value_upper == BLOCK_START:
+                starts.append(index)
+            elif value_upper == BLOCK_END:
+                ends.append(index)
+        return list(zip(starts, ends))
+
+    def parse_column(self, enum: int, column0: str, column1: str, enum_for_value: int) -> dict:
+        values: list = self.columns[column1]
+        with contextlib.suppress(Exception):
+            date_full = DATE_PATTERN.findall(values[enum])
+            ship_name = values[enum].replace(f"({date_full[0]})", "").strip()
+            ship_name = SHIP_NUMBER_SPLIT_PATTERN.split(ship_name)[-1]
+            self.context['ship_name'] = ship_name.strip() or values[enum]
+            date = date_full[0].split("-")
+            self.context['date_arrive'] = date[0].strip()
+            self.context['date_leave'] = date[1].strip()
+        self.context['direction'] = ("import" if values[enum + 1] == 'выгрузка' else "export") \
+            if values[enum + 1] else self.context['direction']
+        self.context['is_empty'] = values[enum + 2] != 'груженые' if values[enum + 2] else self.context['is_empty']
+        type = {'container_size': int("".join(DIGIT_PATTERN.findall(values[enum + 3]))[:2])}
+        count = {'count': int(float(values[enum + enum_for_value]))}
+        line = {'line': self.columns[column0][enum + enum_for_value].rsplit('/', 1)[0].strip()}
+        x = {**line, **type, **count}
+        record = merge_two_dicts(self.context, x)
+        logger.info('data is %s', record, extra=app_logger.SAMPLE_ROWS)
+        return record
+
+    def process(self) -> Iterator[dict]:
+        logger.info(u'file is %s %s', os.path.basename(self.input_file_path), datetime.datetime.now())
+        self.read_columns()
+        zip_list = list(self.columns)
+        month = zip_list[0].rsplit(' ', 1)
+        if month[0].upper().strip() in month_list:
+            month_digit = month_list.index(month[0].strip()) + 1
+        self.context['month'] = month_digit
+        self.context['year'] = int(month[1])
+
+        counter = 0
+        first_column: list = self.columns[zip_list[0]]
+        blocks: List[Tuple[int, int]] = self.get_blocks(first_column)
+        for (enum, ship_name), ship_name_number in zip(enumerate(first_column), self.columns[zip_list[1]]):
+            number_ship = SHIP_NUMBER_PATTERN.findall(ship_name_number)
+            try:
+                if ship_name.upper() == 'НАЗВАНИЕ СУДНА' or number_ship:
+                    for column in zip_list:
+                        start, end = blocks[counter]
+                        offset: int = len(first_column[enum:start + 1])
+                        list_index = [
+                            i + offset
+                            for i, item in enumerate(self.columns[column][start + 1:end])
+                            if DIGIT_PATTERN.search(item)
+                        ]
+                        for enum_for_value in list_index:
+                            yield self.parse_column(enum, zip_list[0], column, enum_for_value)
+                    counter += 1
+            except IndexError:
+                continue
+
+    def main(self) -> None:
+        basename = os.path.basename(self.input_file_path)
+        output_file_path = os.path.join(self.output_folder, basename + '.json')
+        print("output_file_path is {}".format(output_file_path))
+
+        write_json(output_file_path, self.process())
+
+
+if __name__ == "__main__":
+    ReferenceStatistics(sys.argv[1], sys.argv[2]).main()
@@ -0,0 +1,212 @@
+import os
+import time
+import sqlite3
+import requests
+import app_logger
+import threading
+from datetime import datetime
+from requests import Response
+from sqlite_cache import SqliteCache
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+SERVICE_INN_URL: str = os.environ.get("REFERENCE_SERVICE_INN_URL", "http://service_inn:8003")
+MAX_WORKERS: int = int(os.environ.get("REFERENCE_SERVICE_INN_WORKERS", 8))
+CONNECT_TIMEOUT: float = float(os.environ.get("REFERENCE_SERVICE_INN_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT: float = float(os.environ.get("REFERENCE_SERVICE_INN_READ_TIMEOUT", 60))
+RETRIES: int = int(os.environ.get("REFERENCE_SERVICE_INN_RETRIES", 3))
+BACKOFF: float = float(os.environ.get("REFERENCE_SERVICE_INN_BACKOFF", 1))
+# Requests per second in one run.
+RATE_LIMIT: float = float(os.environ.get("REFERENCE_SERVICE_INN_RATE_LIMIT", 10))
+# Requests per day for all files and processes together. The limit of dadata is 10000 requests per day.
+DAILY_LIMIT: int = int(os.environ.get("REFERENCE_SERVICE_INN_DAILY_LIMIT", 10000))
+
+CACHE_DIR: str = os.path.join(os.environ.get("XL_IDP_PATH_REFERENCE_SCRIPTS", "."), "cache")
+# Local cache of the responses: INN -> response of service_inn.
+CACHE_PATH: str = os.path.join(CACHE_DIR, "service_inn.sqlite3")
+# Number of requests to service_inn per day.
+BUDGET_PATH: str = os.path.join(CACHE_DIR, "service_inn_budget.sqlite3")
+CACHE_TTL: float = float(os.environ.get("REFERENCE_SERVICE_INN_CACHE_TTL", 30 * 24 * 60 * 60))
+CACHE_MAX_ENTRIES: int = int(os.environ.get("REFERENCE_SERVICE_INN_CACHE_MAX_ENTRIES", 1000000))
+
+RETRY_STATUSES: tuple = (429, 500, 502, 503, 504)
+
+logger: app_logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.now().date()))
+
+
+class RequestLimitExceeded(requests.exceptions.RequestException):
+    pass
+
+
+def get_cache() -> SqliteCache:
+    """
+    Local cache of service_inn responses with the settings from the environment.
+    """
+    return SqliteCache(CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES)
+
+
+class DailyBudget(object):
+    def __init__(self, path: str = BUDGET_PATH, limit: int = DAILY_LIMIT):
+        """
+        Counter of requests per day in a SQLite file, shared by all files, processes and runs.
+        The counter is changed in a write transaction, so concurrent processes do not exceed the limit together.
+        :param path: Path of the database file. The folder is created if it does not exist.
+        :param limit: Maximum number of requests per day (0 - without limit).
+        """
+        self.path: str = path
+        self.limit: int = limit
+        self.lock: threading.Lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # The connection is used by the threads of the client, the lock serializes them.
+        self.connection: sqlite3.Connection = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                                              check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS budget (day TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+
+    def __enter__(self) -> "DailyBudget":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @staticmethod
+    def today() -> str:
+        return str(datetime.now().date())
+
+    def take(self) -> None:
+        """
+        Count one request of today or raise RequestLimitExceeded if the limit of the day is reached.
+        """
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute("SELECT count FROM budget WHERE day = ?", (self.today(),)).fetchone()
+                count: int = row[0] if row else 0
+                if self.limit and count >= self.limit:
+                    raise RequestLimitExceeded(f"The daily limit of {self.limit} requests to service_inn is exceeded")
+                self.connection.execute("INSERT OR REPLACE INTO budget (day, count) VALUES (?, ?)",
+                                        (self.today(), count + 1))
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def give_back(self) -> None:
+        """
+        Return the request of today, e.g. when service_inn answered from its own cache without dadata.
+        """
+        with self.lock:
+            self.connection.execute("UPDATE budget SET count = MAX(count - 1, 0) WHERE day = ?", (self.today(),))
+
+    def used(self) -> int:
+        with self.lock:
+            row = self.connection.execute("SELECT count FROM budget WHERE day = ?", (self.today(),)).fetchone()
+        return row[0] if row else 0
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class ServiceInnClient(object):
+    def __init__(self, url: str = SERVICE_INN_URL, max_workers: int = MAX_WORKERS,
+                 timeout: Tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT), retries: int = RETRIES,
+                 backoff: float = BACKOFF, rate_limit: float = RATE_LIMIT, budget: Optional[DailyBudget] = None,
+                 cache: Optional[SqliteCache] = None):
+        """
+        Client of service_inn with a pool of keep-alive connections, retries and a throttle.
+        :param url: Address of service_inn.
+        :param max_workers: Number of concurrent requests.
+        :param timeout: Connect and read timeouts in seconds.
+        :param retries: Number of retries on connection errors, timeouts and 429/5xx responses.
+        :param backoff: Delay before the first retry in seconds, doubled on every next retry.
+        :param rate_limit: Maximum number of requests per second in this run (0 - without limit).
+        :param budget: Daily counter of requests. When it is exhausted, the rest of INNs get RequestLimitExceeded.
+        :param cache: Local cache of the responses. INNs found there are not requested.
+        """
+        self.url: str = url
+        self.max_workers: int = max_workers
+        self.timeout: Tuple[float, float] = timeout
+        self.retries: int = retries
+        self.backoff: float = backoff
+        self.interval: float = 1 / rate_limit if rate_limit else 0
+        self.budget: Optional[DailyBudget] = budget
+        self.cache: Optional[SqliteCache] = cache
+        self.count_requests: int = 0
+        self.next_request_time: float = 0
+        self.lock: threading.Lock = threading.Lock()
+        self.session: requests.Session = requests.Session()
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self) -> "ServiceInnClient":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.session.close()
+
+    def acquire(self) -> None:
+        """
+        Count the request in the daily budget and wait for its turn according to the rate limit.
+        """
+        if self.budget:
+            self.budget.take()
+        with self.lock:
+            self.count_requests += 1
+            now: float = time.monotonic()
+            wait: float = self.next_request_time - now
+            self.next_request_time = max(now, self.next_request_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def post(self, inn: str) -> list:
+        """
+        Get data of the company by INN. Returns the response of service_inn: [suggestions, is_from_cache].
+        """
+        for attempt in range(self.retries + 1):
+            self.acquire()
+            try:
+                response: Response = self.session.post(self.url, json={"inn": inn}, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    response.raise_for_status()
+                    data: list = response.json()
+                    if self.budget and isinstance(data, list) and len(data) > 1 and data[1]:
+                        # service_inn answered from its own cache, dadata was not requested.
+                        self.budget.give_back()
+                    return data
+                logger.warning(f"Service_inn returned {response.status_code} for INN {inn}. Attempt {attempt + 1}")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"Request to service_inn failed for INN {inn}. Error is {ex}. Attempt {attempt + 1}")
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def fetch(self, inn: str) -> Union[list, requests.exceptions.RequestException]:
+        try:
+            return self.post(inn)
+        except requests.exceptions.RequestException as ex:
+            return ex
+
+    def fetch_many(self, inns: Iterable[str]) -> Dict[str, Union[list, requests.exceptions.RequestException]]:
+        """
+        Get data for all INNs concurrently. Every INN is requested once, INNs from the local cache are not requested.
+        If the request failed, the exception is returned instead of the data.
+        """
+        unique_inns: List[str] = list(dict.fromkeys(inns))
+        started: float = time.monotonic()
+        # The response from the local cache is marked as taken from the cache (is_company_name_from_cache).
+        cached: dict = self.cache.get_many(unique_inns) if self.cache else {}
+        cached = {inn: [response[0], True] for inn, response in cached.items()}
+        missing_inns: List[str] = [inn for inn in unique_inns if inn not in cached]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            responses: Dict[str, Union[list, Exception]] = dict(
+                zip(missing_inns, executor.map(self.fetch, missing_inns))
+            )
+        if self.cache:
+            self.cache.set_many({inn: response for inn, response in responses.items()
+                                 if not isinstance(response, Exception)})
+        logger.info(f"Got {len(unique_inns)} INNs in {time.monotonic() - started:.2f} s. From local cache: "
+                    f"{len(cached)}, requests to service_inn: {self.count_requests}"
+                    + (f", used today: {self.budget.used()}" if self.budget else ""))
+        responses.update(cached)
+        return {inn: responses[inn] for inn in unique_inns}
@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional
+
+# SQLite in python 3.8 may be built with the limit of 999 variables in one query.
+CHUNK_SIZE: int = 500
+
+
+class SqliteCache(object):
+    def __init__(self, path: str, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        """
+        Persistent key-value cache in a SQLite file. Values are stored as json.
+        :param path: Path of the database file. The folder is created if it does not exist.
+        :param ttl: Time to live of the value in seconds (None - forever).
+        :param max_entries: Maximum number of values, the least recently used are removed (None - without limit).
+        """
+        self.path: str = path
+        self.ttl: Optional[float] = ttl
+        self.max_entries: Optional[int] = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection: sqlite3.Connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self.connection.commit()
+
+    def __enter__(self) -> "SqliteCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Get the values which are in the cache and not expired.
+        """
+        keys = list(dict.fromkeys(keys))
+        now: float = time.time()
+        found: Dict[str, Any] = {}
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk: List[str] = keys[start:start + CHUNK_SIZE]
+            rows = self.connection.execute(
+                f"SELECT key, value, created_at FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for key, value, created_at in rows:
+                if self.ttl is None or now - created_at < self.ttl:
+                    found[key] = json.loads(value)
+        with self.connection:
+            self.connection.executemany("UPDATE cache SET accessed_at = ? WHERE key = ?",
+                                        [(now, key) for key in found])
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        """
+        Save the values and remove the least recently used ones if there are more than max_entries.
+        """
+        now: float = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(value, ensure_ascii=False), now, now) for key, value in items.items()]
+            )
+            if self.ttl is not None:
+                self.connection.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+            if self.max_entries is not None:
+                self.connection.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+                )
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,165 @@
+import os
+import time
+import app_logger
+import threading
+from datetime import datetime
+from sqlite_cache import SqliteCache
+from deep_translator import GoogleTranslator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+# google - Google Translate, transliteration - local transliteration without network (for offline and test runs).
+BACKEND: str = os.environ.get("REFERENCE_TRANSLATOR_BACKEND", "google")
+MAX_WORKERS: int = int(os.environ.get("REFERENCE_TRANSLATOR_WORKERS", 4))
+# Several names are joined by new lines into one request up to this length (the limit of Google is 5000).
+BATCH_LENGTH: int = int(os.environ.get("REFERENCE_TRANSLATOR_BATCH_LENGTH", 4000))
+CACHE_DIR: str = os.path.join(os.environ.get("XL_IDP_PATH_REFERENCE_SCRIPTS", "."), "cache")
+CACHE_MAX_ENTRIES: int = int(os.environ.get("REFERENCE_TRANSLATOR_CACHE_MAX_ENTRIES", 1000000))
+# Time to live of a translation in seconds (0 - forever). A new version starts with an empty cache.
+CACHE_TTL: float = float(os.environ.get("REFERENCE_TRANSLATOR_CACHE_TTL", 180 * 24 * 60 * 60))
+CACHE_VERSION: str = os.environ.get("REFERENCE_TRANSLATOR_CACHE_VERSION", "1")
+
+logger: app_logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", "_") + str(datetime.now().date()))
+
+
+class GoogleBackend(object):
+    def __init__(self, source: str = "en", target: str = "ru", max_workers: int = MAX_WORKERS,
+                 batch_length: int = BATCH_LENGTH):
+        """
+        Translation with Google Translate. GoogleTranslator keeps the parameters of the request in the object,
+        so every thread has its own translator.
+        """
+        self.source: str = source
+        self.target: str = target
+        self.max_workers: int = max_workers
+        self.batch_length: int = batch_length
+        self.local: threading.local = threading.local()
+
+    def get_translator(self) -> GoogleTranslator:
+        if not hasattr(self.local, "translator"):
+            self.local.translator = GoogleTranslator(source=self.source, target=self.target)
+        return self.local.translator
+
+    def translate_one(self, text: str) -> Optional[str]:
+        try:
+            return self.get_translator().translate(text)
+        except Exception as ex:
+            logger.error(f"Failed to translate {text}. Error is {ex}. Type error is {type(ex)}")
+            return None
+
+    def translate_chunk(self, texts: List[str]) -> List[Optional[str]]:
+        """
+        Translate the names joined by new lines in one request. If the number of lines in the translation differs,
+        the names are translated one by one.
+        """
+        if len(texts) > 1:
+            translation: Optional[str] = self.translate_one("\n".join(texts))
+            lines: List[str] = translation.split("\n") if translation else []
+            if len(lines) == len(texts):
+                return [line.strip() for line in lines]
+        return [self.translate_one(text) for text in texts]
+
+    def get_chunks(self, texts: List[str]) -> List[List[str]]:
+        chunks: List[List[str]] = []
+        length: int = 0
+        for text in texts:
+            if "\n" in text:
+                # The name with new lines can't be joined with others, it is translated in its own request.
+                chunks.append([text])
+                length = self.batch_length
+                continue
+            if not chunks or length + len(text) > self.batch_length:
+                chunks.append([])
+                length = 0
+            chunks[-1].append(text)
+            length += len(text) + 1
+        return chunks
+
+    def translate_batch(self, texts: List[str]) -> List[Optional[str]]:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return [translation for chunk in executor.map(self.translate_chunk, self.get_chunks(texts))
+                    for translation in chunk]
+
+
+class TransliterationBackend(object):
+    LETTERS: Dict[str, str] = {
+        "shch": "щ", "sch": "щ", "sh": "ш", "ch": "ч", "zh": "ж", "kh": "х", "ts": "ц", "yu": "ю", "ya": "я",
+        "yo": "ё", "a": "а", "b": "б", "c": "к", "d": "д", "e": "е", "f": "ф", "g": "г", "h": "х", "i": "и",
+        "j": "дж", "k": "к", "l": "л", "m": "м", "n": "н", "o": "о", "p": "п", "q": "к", "r": "р", "s": "с",
+        "t": "т", "u": "у", "v": "в", "w": "в", "x": "кс", "y": "й", "z": "з"
+    }
+
+    def translate_one(self, text: str) -> str:
+        """
+        Transliterate Latin letters to Cyrillic, the longest combination of letters first.
+        """
+        result: List[str] = []
+        index: int = 0
+        while index < len(text):
+            for length in (4, 3, 2, 1):
+                part: str = text[index:index + length]
+                letter: Optional[str] = self.LETTERS.get(part.lower())
+                if letter is not None:
+                    result.append(letter.upper() if part[0].isupper() else letter)
+                    index += length
+                    break
+            else:
+                result.append(text[index])
+                index += 1
+        return "".join(result)
+
+    def translate_batch(self, texts: List[str]) -> List[Optional[str]]:
+        return [self.translate_one(text) for text in texts]
+
+
+BACKENDS: dict = {
+    "google": GoogleBackend,
+    "transliteration": TransliterationBackend
+}
+
+
+class Translator(object):
+    def __init__(self, backend=None, cache: Optional[SqliteCache] = None):
+        """
+        Translation of company names with a persistent cache (name -> translation).
+        :param backend: Object with translate_batch(texts) -> translations (None if the text is not translated).
+        By default, REFERENCE_TRANSLATOR_BACKEND.
+        :param cache: Cache of translations of the same backend (get_cache). Failed translations are not saved.
+        """
+        self.backend = backend or BACKENDS[BACKEND]()
+        self.cache: Optional[SqliteCache] = cache
+
+    def translate_many(self, texts: Iterable[str]) -> Dict[str, str]:
+        """
+        Translate the texts. The texts which are not translated are not in the result.
+        """
+        unique_texts: List[str] = list(dict.fromkeys(text for text in texts if text))
+        started: float = time.monotonic()
+        translations: Dict[str, str] = self.cache.get_many(unique_texts) if self.cache else {}
+        missing_texts: List[str] = [text for text in unique_texts if text not in translations]
+        translated: Dict[str, str] = {
+            text: translation
+            for text, translation in zip(missing_texts, self.backend.translate_batch(missing_texts))
+            if translation is not None
+        }
+        if self.cache:
+            self.cache.set_many(translated)
+        translations.update(translated)
+        logger.info(f"Translated {len(unique_texts)} texts in {time.monotonic() - started:.2f} s. "
+                    f"Hit rate of the cache is {self.cache.hit_rate if self.cache else 0:.2%}. "
+                    f"Not translated: {len(unique_texts) - len(translations)}")
+        return translations
+
+
+def get_cache_path(backend: str = BACKEND, version: str = CACHE_VERSION) -> str:
+    """
+    Every backend has its own file, so e.g. transliterations of a test run are never taken for Google translations.
+    """
+    return os.path.join(CACHE_DIR, f"translations_{backend}_v{version}.sqlite3")
+
+
+def get_cache(backend: str = BACKEND) -> SqliteCache:
+    """
+    Cache of translations of the backend (REFERENCE_TRANSLATOR_BACKEND by default).
+    """
+    return SqliteCache(get_cache_path(backend), ttl=CACHE_TTL or None, max_entries=CACHE_MAX_ENTRIES)
@@ -1,3 +1,5 @@
+import numpy as np
+import pandas as pd
 from stdnum.exceptions import *
 from stdnum.util import clean, isdigits
 
@@ -41,3 +43,60 @@ def is_valid(number):
         return bool(validate(number))
     except ValidationError:
         return False
+
+
+COMPANY_WEIGHTS = np.array((2, 4, 10, 3, 5, 9, 4, 6, 8))
+PERSONAL_WEIGHTS_1 = np.array((7, 2, 4, 10, 3, 5, 9, 4, 6, 8))
+PERSONAL_WEIGHTS_2 = np.array((3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8))
+
+
+def clean_many(numbers):
+    """Clean the numbers the same way as validate. None is returned for
+    numbers which are not strings."""
+    cleaned = []
+    for number in numbers:
+        try:
+            cleaned.append(clean(number, ' ').strip())
+        except InvalidFormat:
+            cleaned.append(None)
+    return cleaned
+
+
+def to_digits(numbers, length):
+    """Convert the numbers of the same length to an array of digits."""
+    return (np.frombuffer(''.join(numbers).encode('ascii'), dtype=np.uint8) - ord('0')).reshape(-1, length)
+
+
+def check_company_many(digits):
+    """Check the check digit of the 10-digit numbers in the array of digits."""
+    return digits[:, :9] @ COMPANY_WEIGHTS % 11 % 10 == digits[:, 9]
+
+
+def check_personal_many(digits):
+    """Check the check digits of the 12-digit numbers in the array of digits."""
+    d1 = digits[:, :10] @ PERSONAL_WEIGHTS_1 % 11 % 10
+    d2 = (digits[:, :10] @ PERSONAL_WEIGHTS_2[:10] + d1 * PERSONAL_WEIGHTS_2[10]) % 11 % 10
+    return (d1 == digits[:, 10]) & (d2 == digits[:, 11])
+
+
+def validate_many(numbers):
+    """Check a list or a pandas Series of numbers at once. The result is the same
+    as is_valid for every number.
+    Returns the boolean mask of valid numbers and the reasons: None for valid
+    numbers, 'format', 'length' or 'checksum' for the others (the same order of
+    checks as in validate). For a Series both results are Series with its index."""
+    cleaned = clean_many(numbers)
+    mask = np.zeros(len(cleaned), dtype=bool)
+    reasons = np.full(len(cleaned), None, dtype=object)
+    is_digits = np.array([n is not None and n.isascii() and n.isdigit() for n in cleaned], dtype=bool)
+    lengths = np.array([len(n) if n is not None else 0 for n in cleaned], dtype=int)
+    reasons[~is_digits] = 'format'
+    reasons[is_digits & (lengths != 10) & (lengths != 12)] = 'length'
+    for length, check in ((10, check_company_many), (12, check_personal_many)):
+        indexes = np.flatnonzero(is_digits & (lengths == length))
+        if len(indexes):
+            mask[indexes] = check(to_digits([cleaned[i] for i in indexes], length))
+            reasons[indexes[~mask[indexes]]] = 'checksum'
+    if isinstance(numbers, pd.Series):
+        return pd.Series(mask, index=numbers.index), pd.Series(reasons, index=numbers.index)
+    return mask, reasons